@@ -0,0 +1,104 @@
+"""
+Per-account rolling aggregates
+-------------------------------------------------------
+Updated as each transaction is written, so the dashboard and the spending
+breakdown render from a few small dicts instead of the full history.
+
+Per-account aggregates are not persisted: Ledger builds them from the
+account's stored history the first time they are needed (one query, the
+same cost as rendering that history once) and updates them in place after
+that. Saving them would add a write to every transaction and a second copy
+of the history that could drift from it. The system-wide totals, which
+would need a scan of every account, are kept by the store instead
+(`Storage.txn_rollup`). Check everything against the raw history with:
+    python aggregates.py rebuild
+"""
+
+import argparse
+from collections import deque
+
+OUTFLOW_TYPES = ("withdraw", "transfer_out", "qr_out", "bill_pay")
+RECENT_N = 5
+
+class AccountAggregates:
+    __slots__ = ("spend_by_category", "count_by_type", "recent", "monthly")
+
+    def __init__(self, recent_n=RECENT_N):
+        self.spend_by_category = {}
+        self.count_by_type = {}
+        self.recent = deque(maxlen=recent_n)
+        self.monthly = {}  # "YYYY-MM" -> {"in": total, "out": total}
+
+    @classmethod
+    def from_transactions(cls, txns, recent_n=RECENT_N):
+        agg = cls(recent_n)
+        for txn in txns: agg.add(txn)
+        return agg
+
+    def add(self, txn):
+        kind, amt = txn["type"], txn["amount"]
+        self.count_by_type[kind] = self.count_by_type.get(kind, 0) + 1
+        self.recent.append(txn)
+        month = self.monthly.setdefault(txn["timestamp"][:7], {"in": 0.0, "out": 0.0})
+        if kind in OUTFLOW_TYPES:
+            self.spend_by_category[txn["category"]] = self.spend_by_category.get(txn["category"], 0.0) + amt
+            month["out"] += amt
+        else:
+            month["in"] += amt
+
+    def to_dict(self):
+        return {"spend_by_category": self.spend_by_category, "count_by_type": self.count_by_type,
+                "recent": list(self.recent), "monthly": self.monthly}
+
+INFLOW_LEGS = ("transfer_in", "qr_in")  # mirror legs, left out of volume so a transfer counts once
+
+class SystemCounters:
+    """System-wide totals for the admin page, updated on every write."""
+
+    def __init__(self, accounts, count_by_type, daily_volume):
+        self.total_funds = sum(a["balance"] for a in accounts.values())
+        self.users = len(accounts)
+        self.count_by_type = dict(count_by_type)
+        self.daily_volume = dict(daily_volume)  # "YYYY-MM-DD" -> amount
+
+    @property
+    def transactions(self):
+        return sum(self.count_by_type.values())
+
+    def add_account(self, acc):
+        self.users += 1
+        self.total_funds += acc["balance"]
+        for txn in acc.get("transactions", []): self._count(txn)
+
+    def add_txn(self, delta, txn):
+        self.total_funds += delta
+        self._count(txn)
+
+    def _count(self, txn):
+        self.count_by_type[txn["type"]] = self.count_by_type.get(txn["type"], 0) + 1
+        if txn["type"] not in INFLOW_LEGS:
+            day = txn["timestamp"][:10]
+            self.daily_volume[day] = self.daily_volume.get(day, 0.0) + txn["amount"]
+
+def main():
+    from ledger import Ledger
+    from storage import open_store
+    ap = argparse.ArgumentParser(description="Recompute aggregates from the raw history and check them.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="rebuild every account's aggregates and check the stored system totals")
+    ap.parse_args()
+
+    ledger = Ledger(open_store())
+    try:
+        counts = {}
+        drifted = ledger.rebuild_aggregates(counts=counts)
+        stored = ledger.store.txn_rollup()[0]
+        print(f"{len(ledger.accounts)} accounts rebuilt from history; cached aggregates differed for {len(drifted)}")
+        for kind in sorted(set(counts) | set(stored)):
+            if counts.get(kind, 0) != stored.get(kind, 0):
+                print(f"  stored count of {kind!r} is {stored.get(kind, 0)}, history has {counts.get(kind, 0)}")
+        if counts == stored: print("stored system totals match the history")
+    finally: ledger.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Spending analytics
+-------------------------------------------------------
+Multi-period reports (in/out trends, category breakdowns, top counterparties
+and a running balance curve) for one user or the whole ledger.
+
+Transactions are streamed from the store in columnar chunks; each chunk is
+grouped with pandas and folded into running totals, so memory follows the
+number of groups (periods, categories, counterparties), not the length of the
+history. A report is cached per (user, period) and recomputed once the ledger
+has seen a new transaction for that user (or for anyone, for user=None).
+
+    python analytics.py [--user alice] [--period W]
+"""
+
+import argparse
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from aggregates import OUTFLOW_TYPES
+from storage import TXN_COLUMNS
+
+PERIODS = {"D": "Daily", "W": "Weekly", "M": "Monthly"}
+CHUNK_ROWS = 200_000
+CACHE_SIZE = 256
+TOP_N = 10
+
+class Report:
+    __slots__ = ("trend", "categories", "counterparties", "balance", "rows")
+
+    def __init__(self, trend, categories, counterparties, balance, rows):
+        self.trend = trend                    # period -> in, out, net, count
+        self.categories = categories          # period x category -> spend
+        self.counterparties = counterparties  # top payees -> amount, count
+        self.balance = balance                # day -> end-of-day balance
+        self.rows = rows
+
+def _add(total, part):
+    return part if total is None else total.add(part, fill_value=0)
+
+def _local_offsets(ts):
+    """Server-local UTC offset at each timestamp, DST included; looked up once per distinct quarter hour."""
+    quarters, where = np.unique(ts // 900, return_inverse=True)  # zone offsets only change on quarter hours
+    return np.array([time.localtime(q * 900).tm_gmtoff for q in quarters.tolist()], dtype=np.float64)[where]
+
+def _buckets(ts, period):
+    """(day, period start) as datetime64 arrays of server-local dates; no per-row objects."""
+    days = ((ts + _local_offsets(ts)) // 86400).astype(np.int64)
+    if period == "D": start = days
+    elif period == "W": start = days - (days + 3) % 7  # 1970-01-01 was a Thursday; weeks start Monday
+    else: start = days.astype("datetime64[D]").astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    as_dt = lambda d: (d * 86400).astype("datetime64[s]")
+    return as_dt(days), as_dt(start)
+
+def _fold(chunks, period):
+    """One pass over the chunks; returns the partial sums of every report."""
+    trend = cats = cps = daily = None
+    rows = 0
+    for chunk in chunks:
+        df = pd.DataFrame.from_records(chunk, columns=TXN_COLUMNS)
+        rows += len(df)
+        is_out = df["type"].isin(OUTFLOW_TYPES).to_numpy()
+        amt = df["amount"].to_numpy(dtype=np.float64)
+        df["in"] = np.where(is_out, 0.0, amt)
+        df["out"] = np.where(is_out, amt, 0.0)
+        df["day"], df["period"] = _buckets(df["ts"].to_numpy(dtype=np.float64), period)
+
+        trend = _add(trend, df.groupby("period").agg(**{"in": ("in", "sum"), "out": ("out", "sum"),
+                                                        "count": ("in", "size")}))
+        daily = _add(daily, (df["in"] - df["out"]).groupby(df["day"]).sum())
+        spend = df[is_out]
+        cats = _add(cats, spend.groupby(["period", "category"])["amount"].sum())
+        cps = _add(cps, spend.groupby("counterparty")["amount"].agg(amount="sum", count="size"))
+    return trend, cats, cps, daily, rows
+
+def build_report(chunks, period="M", balance=0.0, top_n=TOP_N):
+    """Fold (ts, type, amount, category, counterparty) chunks into a Report.
+
+    `balance` is the current balance; the curve is anchored on it, so histories
+    with an opening balance outside the ledger still end at the right figure.
+    """
+    trend, cats, cps, daily, rows = _fold(chunks, period)
+    if not rows:
+        return Report(pd.DataFrame(columns=["in", "out", "net", "count"]), pd.DataFrame(),
+                      pd.DataFrame(columns=["amount", "count"]), pd.Series(dtype=float, name="balance"), 0)
+    trend = trend.sort_index()
+    trend["net"] = trend["in"] - trend["out"]
+    trend["count"] = trend["count"].astype(int)
+    if cats is not None and len(cats):
+        cats = cats.unstack("category", fill_value=0.0).sort_index()
+    else: cats = pd.DataFrame()
+    if cps is not None and len(cps):
+        cps = cps.nlargest(top_n, "amount")
+        cps["count"] = cps["count"].astype(int)
+    else: cps = pd.DataFrame(columns=["amount", "count"])
+    daily = daily.sort_index()
+    curve = daily.cumsum() + (balance - daily.sum())
+    return Report(trend[["in", "out", "net", "count"]], cats, cps, curve.rename("balance"), rows)
+
+class Analytics:
+    """Cached reports over a Ledger's store; one instance per server process."""
+
+    def __init__(self, ledger, chunk_rows=CHUNK_ROWS, cache_size=CACHE_SIZE):
+        self.ledger = ledger
+        self.chunk_rows = chunk_rows
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (user, period) -> (txn version, Report)
+        self._guard = threading.Lock()
+
+    def report(self, user=None, period="M"):
+        if period not in PERIODS: raise ValueError(f"Unknown period: {period}")
+        key = (user, period)
+        version = self.ledger.txn_version(user)  # read first: a write during the scan forces a redo
+        with self._guard:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] == version:
+                self._cache.move_to_end(key)
+                return hit[1]
+        if user is None: balance = self.ledger.total_funds()
+        else: balance = (self.ledger.account(user) or {}).get("balance", 0.0)
+        rep = build_report(self.ledger.store.iter_txn_chunks(user, self.chunk_rows), period, balance)
+        with self._guard:
+            self._cache[key] = (version, rep)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+        return rep
+
+def main():
+    from ledger import Ledger
+    from storage import open_store
+    ap = argparse.ArgumentParser(description="Print spending analytics for a user or the whole ledger.")
+    ap.add_argument("--user", help="default: all users")
+    ap.add_argument("--period", choices=list(PERIODS), default="M")
+    args = ap.parse_args()
+    ledger = Ledger(open_store())
+    rep = Analytics(ledger).report(args.user, args.period)
+    with pd.option_context("display.width", 160, "display.max_columns", 20):
+        print(f"{rep.rows:,} transactions\n\n== {PERIODS[args.period]} trend\n{rep.trend}")
+        print(f"\n== Spend by category\n{rep.categories}\n\n== Top counterparties\n{rep.counterparties}")
+        if len(rep.balance): print(f"\n== Balance: {rep.balance.iloc[0]:,.2f} -> {rep.balance.iloc[-1]:,.2f}")
+    ledger.close()
+
+if __name__ == "__main__":
+    main()
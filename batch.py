@@ -0,0 +1,116 @@
+"""
+Headless batch payouts / statement import
+-------------------------------------------------------
+Streams a CSV or JSONL file of operations through the Ledger, with the same
+checks as the Streamlit forms, and writes one result row per input row.
+
+    python batch.py payouts.csv --out results.csv --chunk 1000
+
+Columns: op (deposit | withdraw | transfer | bill_pay | qr_pay), user, to,
+amount, note, category, biller, consumer_no, key. `key` is an optional
+idempotency key; rows repeating an earlier key are not applied twice. Each
+chunk of rows is persisted with a single storage append.
+
+Run it against the same storage backend as the app while the app is stopped:
+a chunk is visible in memory before it is stored, and no per-user locks are
+taken, which is only safe while nothing else writes to the ledger.
+
+Throughput (benchmarks/bench_batch.py, 200k rows, one core): about 18k
+rows/s on the JSON backend, 8k on SQLite, short of the 50k target. Storage
+writes and fsyncs are already one per chunk and locks are skipped, so what is
+left is per-row Python work: about half goes to the store applying records to
+its replica (packing rows into TxnColumns), most of the rest to the Ledger's
+checks and record building, and under a tenth to encoding the chunk's journal
+line. Going further means shrinking that per-record work, not batching more.
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+from ledger import Ledger, LedgerError, amount_error, consumer_no_error
+from storage import open_store
+
+OPS = ("deposit", "withdraw", "transfer", "bill_pay", "qr_pay")
+RESULT_FIELDS = ("row", "status", "txn_id", "error")
+
+def read_rows(path):
+    """Yield operation dicts from a .csv or .jsonl file, one at a time."""
+    with open(path, newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip(): yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def apply_row(ledger, row):
+    op = row.get("op")
+    user = (row.get("user") or "").strip().lower()
+    to = (row.get("to") or "").strip().lower()
+    key = row.get("key") or None
+    try: amt = float(row.get("amount") or 0)
+    except (TypeError, ValueError): raise LedgerError("Invalid Amount")
+    if amount_error(amt): raise LedgerError(amount_error(amt))  # float() also accepts "inf" and "nan"
+    if op not in OPS: raise LedgerError(f"Unknown op: {op}")
+    if user not in ledger: raise LedgerError("User not found")
+    if op == "deposit":
+        return ledger.deposit(user, amt, row.get("note") or "Wallet Load", idem_key=key)
+    if op == "withdraw":
+        return ledger.withdraw(user, amt, row.get("note") or "Cash", row.get("category") or "Other", idem_key=key)
+    if op == "bill_pay":
+        err = consumer_no_error(str(row.get("consumer_no") or ""))
+        if err: raise LedgerError(err)
+        return ledger.pay_bill(user, amt, row.get("biller") or "Bill", idem_key=key)
+    if not to or to not in ledger: raise LedgerError("User not found")
+    if op == "transfer":
+        return ledger.transfer(user, to, amt, row.get("note") or "Payment", idem_key=key)
+    return ledger.qr_pay(user, to, amt, row.get("category") or "Other", idem_key=key)
+
+def run_batch(ledger, rows, chunk=1000):
+    """Apply rows in chunks; yields one result dict per input row."""
+    rows, results, n = iter(rows), [], 0
+    while True:
+        with ledger.batch():
+            for row in rows:
+                n += 1
+                try:
+                    txn = apply_row(ledger, row)
+                    results.append({"row": n, "status": "ok", "txn_id": txn["id"], "error": ""})
+                except LedgerError as e:
+                    results.append({"row": n, "status": "error", "txn_id": "", "error": str(e)})
+                if len(results) >= chunk: break
+        if not results: return
+        yield from results
+        if len(results) < chunk: return
+        results = []
+
+def write_results(path, results):
+    with open(path, "w", newline="") as f:
+        if path.endswith(".jsonl"):
+            for res in results: f.write(json.dumps(res) + "\n")
+        else:
+            w = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            w.writeheader(); w.writerows(results)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Apply a file of wallet operations")
+    ap.add_argument("src", help=".csv or .jsonl file of operations")
+    ap.add_argument("--out", help="result file (.csv or .jsonl); default <src>.results.csv")
+    ap.add_argument("--chunk", type=int, default=1000)
+    ap.add_argument("--backend", choices=("json", "sqlite"))
+    args = ap.parse_args()
+    out = args.out or os.path.splitext(args.src)[0] + ".results.csv"
+    ledger = Ledger(open_store(args.backend))
+    stats = {"ok": 0, "error": 0}
+    def counted(results):
+        for res in results:
+            stats[res["status"]] += 1
+            yield res
+    t = time.perf_counter()
+    write_results(out, counted(run_batch(ledger, read_rows(args.src), args.chunk)))
+    ledger.close()
+    dt = time.perf_counter() - t
+    total = stats["ok"] + stats["error"]
+    print(f"{total} rows: {stats['ok']} ok, {stats['error']} rejected in {dt:.2f} s ({total / max(dt, 1e-9):,.0f} ops/s) -> {out}")
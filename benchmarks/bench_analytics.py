@@ -0,0 +1,76 @@
+"""
+Analytics benchmark: chunked multi-period reports over large histories.
+
+    python benchmarks/bench_analytics.py --users 1000 --txns 2000000 --backend sqlite
+
+Seeds one "whale" account holding half the rows plus a long tail, then times
+a cold report for the whale and for the whole ledger in each period, a cached
+hit, and the recompute after one new transaction. Peak RSS is reported so the
+chunked fold can be compared against loading everything into one DataFrame.
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics import PERIODS, Analytics
+from ledger import Ledger
+from storage import JournalStore, SQLiteStore, create_record
+
+TYPES = ["deposit", "withdraw", "transfer_out", "transfer_in", "bill_pay", "qr_out", "qr_in"]
+CATS = ["Food", "Travel", "Bills", "Shopping", "Education", "Health", "Other"]
+
+def synth(users, txns, seed=3):
+    rng = random.Random(seed)
+    now = time.time()
+    sizes = [txns // 2] + [max(1, txns // 2 // (users - 1))] * (users - 1)
+    for i, n in enumerate(sizes):
+        start = now - 3 * 365 * 86400
+        step = 3 * 365 * 86400 / n
+        tx = [{"id": f"T{i}-{j}", "timestamp": "", "ts": start + j * step, "type": rng.choice(TYPES),
+               "amount": float(rng.randint(1, 5000)), "note": "", "category": rng.choice(CATS),
+               "counterparty": f"user{rng.randrange(users)}"} for j in range(n)]
+        yield f"user{i}", {"pin": "x", "balance": 1e6, "locked": False, "transactions": tx, "notifications": []}
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--txns", type=int, default=1_000_000)
+    ap.add_argument("--backend", choices=("json", "sqlite"), default="sqlite")
+    ap.add_argument("--chunk", type=int, default=200_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        store = (JournalStore(os.path.join(d, "w.json")) if args.backend == "json"
+                 else SQLiteStore(os.path.join(d, "w.db")))
+        t = time.perf_counter()
+        for user, acc in synth(args.users, args.txns): store.append(create_record(user, acc))
+        store.flush()
+        print(f"seeded {args.txns:,} rows in {time.perf_counter() - t:.1f} s, RSS {rss_mb():.0f} MB")
+        ledger = Ledger(store)
+        an = Analytics(ledger, chunk_rows=args.chunk)
+
+        for user, label in (("user0", "whale"), (None, "all users")):
+            for period in PERIODS:
+                t = time.perf_counter(); rep = an.report(user, period); cold = time.perf_counter() - t
+                t = time.perf_counter(); an.report(user, period); hot = time.perf_counter() - t
+                print(f"{label:10s} {PERIODS[period]:8s} {rep.rows:>10,} rows  cold {cold:7.2f} s "
+                      f"({rep.rows / cold / 1e6:5.2f} M rows/s)  cached {hot * 1e6:6.1f} µs  RSS {rss_mb():.0f} MB")
+        an.report("user1", "M")
+        ledger.deposit("user0", 10.0)
+        t = time.perf_counter(); an.report("user0", "M")
+        print(f"whale after a new deposit: recomputed in {time.perf_counter() - t:.2f} s")
+        t = time.perf_counter(); an.report("user1", "M")
+        print(f"other user unaffected: {(time.perf_counter() - t) * 1e6:.1f} µs")
+        ledger.close()
+
+if __name__ == "__main__":
+    main()
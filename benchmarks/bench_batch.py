@@ -0,0 +1,45 @@
+"""
+Batch import throughput.
+
+    python benchmarks/bench_batch.py --users 1000 --rows 200000 [--backend sqlite]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batch import run_batch
+from ledger import Ledger
+from storage import JournalStore, SQLiteStore
+
+def synth_rows(users, n, seed=3):
+    rng = random.Random(seed)
+    for _ in range(n):
+        op = rng.choice(("deposit", "transfer", "transfer", "bill_pay", "qr_pay"))
+        src, dst = rng.sample(range(users), 2)
+        yield {"op": op, "user": f"u{src}", "to": f"u{dst}", "amount": str(rng.randint(1, 500)),
+               "biller": "⚡ Electricity Bill", "consumer_no": "12345678"}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--chunk", type=int, default=1000)
+    ap.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    args = ap.parse_args()
+    seed = lambda: {f"u{i}": {"pin": "x", "balance": 10_000.0, "locked": False, "transactions": [], "notifications": []}
+                    for i in range(args.users)}
+    with tempfile.TemporaryDirectory() as d:
+        if args.backend == "json": store = JournalStore(os.path.join(d, "w.json"), default=seed, compact_every=10**9)
+        else: store = SQLiteStore(os.path.join(d, "w.db"), default=seed)
+        ledger = Ledger(store)
+        rows = list(synth_rows(args.users, args.rows))
+        t = time.perf_counter()
+        ok = sum(r["status"] == "ok" for r in run_batch(ledger, iter(rows), args.chunk))
+        ledger.close()
+        dt = time.perf_counter() - t
+        print(f"[{args.backend}] {args.rows} rows ({ok} ok) in {dt:.2f} s -> {args.rows / dt:,.0f} ops/s")
@@ -0,0 +1,68 @@
+"""
+Concurrent transfer stress test for Ledger.transfer.
+
+    python benchmarks/bench_contention.py --threads 32 --transfers 20000 --hot 8
+
+Fires transfers between a few hot accounts from a thread pool (plus replayed
+idempotency keys), then checks that total system funds are conserved and no
+balance went negative.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ledger import Ledger, LedgerError
+from storage import JournalStore
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--transfers", type=int, default=20_000)
+    ap.add_argument("--hot", type=int, default=8)
+    ap.add_argument("--replay", type=float, default=0.05, help="share of requests that reuse an earlier idempotency key")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        users = [f"hot{i}" for i in range(args.hot)]
+        seed = lambda: {u: {"pin": "x", "balance": 1000.0, "locked": False, "transactions": [], "notifications": []} for u in users}
+        ledger = Ledger(JournalStore(os.path.join(d, "w.json"), default=seed))
+        before = ledger.total_funds()
+        rng = random.Random(42)
+        jobs = []
+        for i in range(args.transfers):
+            src, dst = rng.sample(users, 2)
+            key = f"k{rng.randrange(i)}" if i and rng.random() < args.replay else f"k{i}"
+            jobs.append((src, dst, float(rng.randint(1, 300)), key))
+
+        def run(job):
+            t = time.perf_counter()
+            try: ledger.transfer(*job[:3], idem_key=job[3]); ok = True
+            except LedgerError: ok = False
+            return time.perf_counter() - t, ok
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool: results = list(pool.map(run, jobs))
+        wall = time.perf_counter() - t0
+        ledger.close()
+
+        lat = sorted(r[0] for r in results)
+        after = ledger.total_funds()
+        negative = [u for u in users if ledger.account(u)["balance"] < 0]
+        print(f"transfers      {len(jobs)} ({sum(r[1] for r in results)} applied or replayed, rest rejected)")
+        print(f"throughput     {len(jobs) / wall:,.0f} ops/s over {args.threads} threads")
+        print(f"latency        p50 {lat[len(lat) // 2] * 1e3:.3f} ms  p99 {lat[int(len(lat) * 0.99)] * 1e3:.3f} ms")
+        print(f"funds          before ₹{before:,.2f}  after ₹{after:,.2f}")
+        reloaded = JournalStore(os.path.join(d, "w.json")).load()
+        assert abs(sum(a["balance"] for a in reloaded.values()) - before) < 1e-6, "funds not conserved on disk"
+        assert abs(after - before) < 1e-6, "funds not conserved"
+        assert not negative, f"negative balances: {negative}"
+        print("OK: funds conserved, no negative balances")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+PIN verification latency at different KDF costs.
+
+    python benchmarks/bench_pin.py --n 50
+
+"login" is a full KDF verification; "payment" is a form submit inside the
+step-up TTL, answered from StepUpCache.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from security import StepUpCache, hash_pin, verify_pin
+
+SETTINGS = [("pbkdf2", 10_000), ("pbkdf2", 100_000), ("pbkdf2", 200_000), ("pbkdf2", 600_000),
+            ("scrypt", 2 ** 13), ("scrypt", 2 ** 14), ("scrypt", 2 ** 15)]
+
+def pct(lat, q):
+    lat = sorted(lat)
+    return lat[min(len(lat) - 1, int(len(lat) * q))] * 1e3
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=50)
+    args = ap.parse_args()
+    print(f"{'hasher':8s} {'cost':>8s}  {'login p50':>10s} {'login p99':>10s}  {'payment p50':>12s} {'payment p99':>12s}")
+    for scheme, cost in SETTINGS:
+        stored = hash_pin("1234", scheme, cost)
+        login = []
+        for _ in range(args.n):
+            t = time.perf_counter(); verify_pin("1234", stored); login.append(time.perf_counter() - t)
+        cache = StepUpCache()
+        cache.verify("sid", "alice", "1234", stored)
+        pay = []
+        for _ in range(args.n * 20):
+            t = time.perf_counter(); cache.verify("sid", "alice", "1234", stored); pay.append(time.perf_counter() - t)
+        print(f"{scheme:8s} {cost:>8d}  {pct(login, .5):8.2f}ms {pct(login, .99):8.2f}ms  {pct(pay, .5):10.4f}ms {pct(pay, .99):10.4f}ms")
@@ -0,0 +1,38 @@
+"""
+QR rendering throughput: cold render, cached render and batch export.
+
+    python benchmarks/bench_qr.py --n 2000 --workers 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from qrcache import export_qrs, payment_qr, render_qr_png
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = ap.parse_args()
+
+    t = time.perf_counter()
+    for i in range(200): payment_qr(f"m{i}", 100)
+    cold = (time.perf_counter() - t) / 200
+    t = time.perf_counter()
+    for _ in range(10):
+        for i in range(200): payment_qr(f"m{i}", 100)
+    warm = (time.perf_counter() - t) / 2000
+    print(f"render (cold)   {cold * 1e3:8.3f} ms/image  {1 / cold:10,.0f} images/s")
+    print(f"render (cached) {warm * 1e3:8.3f} ms/image  {1 / warm:10,.0f} images/s  {render_qr_png.cache_info()}")
+
+    users = [f"merchant{i}" for i in range(args.n)]
+    with tempfile.TemporaryDirectory() as d:
+        for w in args.workers:
+            t = time.perf_counter()
+            export_qrs(users, os.path.join(d, f"qrs{w}.zip"), workers=w)
+            dt = time.perf_counter() - t
+            print(f"export {w} worker(s) {args.n / dt:10,.0f} images/s")
@@ -0,0 +1,109 @@
+"""
+Risk scoring benchmark: payment-path cost of streaming and batch rescan speed.
+
+    python benchmarks/bench_scoring.py --backend sqlite --txns 1000000 --workers 1,2,4,8
+
+Part 1 runs concurrent transfers against a Ledger with and without a Scorer
+attached, and reports throughput, p50 / p99 latency and how long the scoring
+thread needs to catch up afterwards. Part 2 seeds a history and times
+`rescan` on process pools of each size.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ledger import Ledger
+from scoring import Scorer, rescan
+from storage import JournalStore, SQLiteStore, create_record
+
+TYPES = ["deposit", "withdraw", "transfer_out", "transfer_in", "bill_pay", "qr_out", "qr_in"]
+CATS = ["Food", "Travel", "Bills", "Shopping", "Education", "Health", "Other"]
+
+def open_backend(backend, d, name):
+    return JournalStore(os.path.join(d, name + ".json")) if backend == "json" else SQLiteStore(os.path.join(d, name + ".db"))
+
+def blank(balance):
+    return {"pin": "x", "balance": balance, "locked": False, "transactions": [], "notifications": []}
+
+def payments(backend, d, users, ops, threads, scored):
+    store = open_backend(backend, d, f"pay{int(scored)}")
+    store.append(*(create_record(f"user{i}", blank(1e9)) for i in range(users)))
+    ledger = Ledger(store)
+    scorer = Scorer(ledger).start(backfill=False) if scored else None
+    lat = []
+
+    def worker(seed):
+        rng, mine = random.Random(seed), []
+        for _ in range(ops // threads):
+            a, b = rng.sample(range(users), 2)
+            t = time.perf_counter()
+            ledger.transfer(f"user{a}", f"user{b}", rng.randint(1, 5000))
+            mine.append(time.perf_counter() - t)
+        lat.extend(mine)
+
+    pool = [threading.Thread(target=worker, args=(s,)) for s in range(threads)]
+    t = time.perf_counter()
+    for th in pool: th.start()
+    for th in pool: th.join()
+    elapsed = time.perf_counter() - t
+    lag, catch_up = 0, 0.0
+    if scorer:
+        lag = scorer.lag()
+        while scorer.lag(): time.sleep(0.001)
+        catch_up = time.perf_counter() - t - elapsed
+        scorer.stop()
+    ledger.close()
+    lat.sort()
+    return len(lat) / elapsed, lat[len(lat) // 2], lat[int(len(lat) * 0.99)], lag, catch_up
+
+def seed(store, users, txns, seed=9):
+    rng = random.Random(seed)
+    start, per = time.time() - 365 * 86400, max(1, txns // users)
+    for i in range(users):
+        tx = [{"id": f"T{i}-{j}", "timestamp": "", "ts": start + j * 365 * 86400 / per, "type": rng.choice(TYPES),
+               "amount": float(rng.randint(1, 5000)), "note": "", "category": rng.choice(CATS),
+               "counterparty": f"user{rng.randrange(users)}"} for j in range(per)]
+        store.append(create_record(f"user{i}", dict(blank(1e6), transactions=tx)))
+    store.flush()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--ops", type=int, default=40_000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--txns", type=int, default=500_000)
+    ap.add_argument("--workers", default="1,2,4")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        print(f"== payment path: {args.ops:,} transfers, {args.threads} threads, {args.backend}")
+        for scored in (False, True):
+            ops_s, p50, p99, lag, catch_up = payments(args.backend, d, args.users, args.ops, args.threads, scored)
+            extra = f"  queue at end {lag:,}, caught up in {catch_up * 1e3:.0f} ms" if scored else ""
+            print(f"{'with scorer' if scored else 'no scorer':12s} {ops_s:8,.0f} ops/s  p50 {p50 * 1e6:6.0f} µs  "
+                  f"p99 {p99 * 1e6:6.0f} µs{extra}")
+
+        store = open_backend(args.backend, d, "history")
+        seed(store, args.users, args.txns)
+        store.load()
+        print(f"\n== rescan: {args.users:,} users, {args.txns:,} transactions")
+        base = None
+        for workers in (int(w) for w in args.workers.split(",")):
+            t = time.perf_counter()
+            features, _, counts = rescan(store, workers)
+            elapsed = time.perf_counter() - t
+            rows = sum(f.n for f in features.values())
+            base = base or elapsed
+            print(f"{workers:2d} workers {elapsed:7.2f} s  {rows / elapsed / 1e3:7.0f}k rows/s  x{base / elapsed:.1f}  "
+                  f"flags {sum(counts.values()):,}")
+        store.close()
+
+if __name__ == "__main__":
+    main()
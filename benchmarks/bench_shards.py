@@ -0,0 +1,84 @@
+"""
+Sharded storage benchmark: transfer throughput as processes are added.
+
+    python benchmarks/bench_shards.py --backend sqlite --shards 8 --procs 1,2,4,8
+
+Seeds a fresh set of shards, then runs the same number of transfers split
+over P worker processes, each with its own ShardedStore and Ledger (as app
+replicas would). Reports aggregate ops/s and the share of cross-shard
+transfers, and checks that funds are conserved and no outbox entry is left
+pending. Scaling needs free cores: on a single CPU the processes only
+interleave.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ledger import Ledger, LedgerError
+from sharding import ShardedStore, shard_of
+from storage import create_record
+
+START = 1e6
+
+def blank(balance):
+    return {"pin": "x", "balance": balance, "locked": False, "transactions": [], "notifications": []}
+
+def worker(backend, shards, base, users, ops, seed, out):
+    ledger = Ledger(ShardedStore(backend, shards, base=base))
+    rng, done, cross = random.Random(seed), 0, 0
+    for _ in range(ops):
+        a, b = rng.sample(range(users), 2)
+        try:
+            ledger.transfer(f"user{a}", f"user{b}", rng.randint(1, 5000))
+            done += 1; cross += shard_of(f"user{a}", shards) != shard_of(f"user{b}", shards)
+        except LedgerError: pass
+    ledger.close()
+    out.put((done, cross))
+
+def run(backend, d, shards, procs, users, ops):
+    base = os.path.join(d, f"p{procs}.{'json' if backend == 'json' else 'db'}")
+    store = ShardedStore(backend, shards, base=base, relay_interval=0)
+    store.append(*(create_record(f"user{i}", blank(START)) for i in range(users)))
+    store.close()
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    pool = [ctx.Process(target=worker, args=(backend, shards, base, users, ops // procs, s, out)) for s in range(procs)]
+    t = time.perf_counter()
+    for p in pool: p.start()
+    results = [out.get() for _ in pool]
+    for p in pool: p.join()
+    elapsed = time.perf_counter() - t
+    store = ShardedStore(backend, shards, base=base, relay_interval=0)
+    total = sum(a["balance"] for a in store.load().values())
+    pending = sum(len(s.pending_outbox()) for s in store.shards)
+    store.close()
+    done, cross = map(sum, zip(*results))
+    return done / elapsed, cross / max(done, 1), abs(total - users * START) < 1e-6 and not pending
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--ops", type=int, default=20_000)
+    ap.add_argument("--procs", default="1,2,4")
+    args = ap.parse_args()
+
+    print(f"== {args.ops:,} transfers, {args.users:,} users, {args.shards} shards, {args.backend}, "
+          f"{os.cpu_count()} CPUs")
+    with tempfile.TemporaryDirectory() as d:
+        base = None
+        for procs in (int(p) for p in args.procs.split(",")):
+            ops_s, cross, ok = run(args.backend, d, args.shards, procs, args.users, args.ops)
+            base = base or ops_s
+            print(f"{procs:2d} processes {ops_s:8,.0f} ops/s  x{ops_s / base:.1f}  cross-shard {cross:4.0%}  "
+                  f"{'conserved' if ok else 'MISMATCH'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Cold-start benchmark: time to first render of the login screen.
+
+    python benchmarks/bench_startup.py                   # working tree
+    python benchmarks/bench_startup.py --rev HEAD~1      # also measure an older commit
+
+Each sample is a fresh interpreter running main.py once through Streamlit's
+AppTest in an empty data directory, the same work a restarted pod does for
+its first visitor. It reports time to first render (from interpreter start),
+which heavy modules were loaded, and whether the wallet store was opened
+before anyone logged in.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("pandas", "plotly", "qrcode", "PIL", "pyarrow")
+
+DRIVER = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.join(sys.argv[1], "main.py"), default_timeout=120)
+at.run()
+first = time.perf_counter() - t0
+print(json.dumps({
+    "first_render_s": first,
+    "login_shown": any("Login" in h.value for h in at.subheader),
+    "exceptions": [str(e.value) for e in at.exception],
+    "heavy_loaded": sorted({m.split(".")[0] for m in sys.modules} & set(sys.argv[2].split(","))),
+    "store_opened": any(f.startswith("wallet_data") for f in os.listdir(".")),
+}))
+"""
+
+def sample(app_dir):
+    with tempfile.TemporaryDirectory() as cwd:
+        env = dict(os.environ, PYTHONPATH=app_dir)
+        out = subprocess.run([sys.executable, "-c", DRIVER, app_dir, ",".join(HEAVY)], cwd=cwd, env=env,
+                             capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+def measure(label, app_dir, runs):
+    samples = [sample(app_dir) for _ in range(runs)]
+    first = [s["first_render_s"] for s in samples]
+    last = samples[-1]
+    print(f"{label:>12s}: first render median {statistics.median(first) * 1e3:8.1f} ms "
+          f"(min {min(first) * 1e3:.1f} ms)")
+    print(f"{'':>12s}  login shown: {last['login_shown']}, store opened: {last['store_opened']}, "
+          f"heavy modules: {', '.join(last['heavy_loaded']) or 'none'}")
+    for e in last["exceptions"]: print(f"{'':>12s}  exception: {e}")
+    return statistics.median(first)
+
+def export_rev(rev, dest):
+    blob = subprocess.run(["git", "archive", rev], cwd=REPO, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=BytesIO(blob)) as tar: tar.extractall(dest)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--rev", help="git revision to measure for comparison")
+    args = ap.parse_args()
+    try: import streamlit.testing.v1  # noqa: F401
+    except ImportError: sys.exit("streamlit (with streamlit.testing) is required for this benchmark")
+
+    now = measure("working tree", REPO, args.runs)
+    if args.rev:
+        with tempfile.TemporaryDirectory() as d:
+            export_rev(args.rev, d)
+            old = measure(args.rev, d, args.runs)
+        print(f"\nspeedup vs {args.rev}: x{old / now:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Storage backend benchmark: JournalStore vs SQLiteStore.
+
+    python benchmarks/bench_storage.py --users 10000 --txns 1000000
+
+Reports bulk load, cold open, single-operation write latency, the dashboard /
+history / admin queries and the on-disk size of each backend.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import JournalStore, SQLiteStore, create_record, txn_record
+
+TYPES = ["deposit", "withdraw", "transfer_out", "transfer_in", "bill_pay", "qr_out", "qr_in"]
+CATS = ["Food", "Travel", "Bills", "Shopping", "Education", "Health", "Other"]
+
+def synth_accounts(users, txns, seed=7):
+    rng = random.Random(seed)
+    per_user = max(1, txns // users)
+    for i in range(users):
+        tx = [{"id": f"TXN-{i}-{j}", "timestamp": f"2025-{1 + j % 12:02d}-{1 + j % 28:02d} 10:{j % 60:02d}",
+               "type": rng.choice(TYPES), "amount": float(rng.randint(1, 5000)), "note": "bench",
+               "category": rng.choice(CATS), "counterparty": f"user{rng.randrange(users)}"} for j in range(per_user)]
+        yield f"user{i}", {"pin": "x", "balance": 10_000.0, "locked": False, "is_verified": True,
+                           "enable_2fa": False, "transactions": tx, "notifications": []}
+
+def timed(fn, n):
+    lat = []
+    for _ in range(n):
+        t = time.perf_counter(); fn(); lat.append(time.perf_counter() - t)
+    lat.sort()
+    return statistics.median(lat) * 1e3, lat[int(len(lat) * 0.99) - 1] * 1e3
+
+def disk_size(paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p)) / 1e6
+
+def bench(name, make, paths, args):
+    rng = random.Random(1)
+    store = make()
+    t = time.perf_counter()
+    chunk = []
+    for user, acc in synth_accounts(args.users, args.txns):
+        chunk.append(create_record(user, acc))
+        if len(chunk) == 500: store.append(*chunk); chunk = []
+    store.append(*chunk)
+    store.flush()
+    print(f"[{name}] bulk load       {time.perf_counter() - t:8.2f} s")
+    store.close()
+
+    t = time.perf_counter()
+    store = make()
+    store.load()
+    print(f"[{name}] cold open+load  {time.perf_counter() - t:8.2f} s")
+
+    pick = lambda: f"user{rng.randrange(args.users)}"
+    txn = {"id": "TXN-x", "timestamp": "2025-06-01 10:00", "type": "deposit", "amount": 10.0,
+           "note": "bench", "category": "Other", "counterparty": "Bank"}
+    for label, fn in [("write 1 txn", lambda: store.append(txn_record(pick(), 10.0, txn))),
+                      ("dashboard top5", lambda: store.transactions(pick(), limit=5)),
+                      ("history (all)", lambda: store.transactions(pick())),
+                      ("contacts", lambda: store.counterparties(pick(), ("transfer_out", "qr_out")))]:
+        p50, p99 = timed(fn, args.ops)
+        print(f"[{name}] {label:15s} p50 {p50:8.3f} ms  p99 {p99:8.3f} ms")
+    p50, _ = timed(store.account_summaries, 3)
+    print(f"[{name}] admin summaries {p50:8.1f} ms")
+    store.close()
+    print(f"[{name}] disk            {disk_size(paths):8.1f} MB")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=10_000)
+    ap.add_argument("--txns", type=int, default=1_000_000)
+    ap.add_argument("--ops", type=int, default=1000)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        j, s = os.path.join(d, "w.json"), os.path.join(d, "w.db")
+        bench("json", lambda: JournalStore(j), [j, os.path.join(d, "w.journal")], args)
+        bench("sqlite", lambda: SQLiteStore(s), [s, s + "-wal"], args)
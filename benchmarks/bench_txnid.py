@@ -0,0 +1,63 @@
+"""
+Transaction ID microbenchmark and uniqueness stress test.
+
+    python benchmarks/bench_txnid.py --n 1000000 --threads 8 --procs 4
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from txnid import _default, new_txn_id
+
+def burst(n):
+    return [new_txn_id() for _ in range(n)]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--procs", type=int, default=4)
+    args = ap.parse_args()
+
+    t = time.perf_counter()
+    ids = burst(args.n)
+    dt = time.perf_counter() - t
+    print(f"single thread  {args.n / dt:,.0f} ids/s")
+    assert ids == sorted(ids) and len(set(ids)) == len(ids), "not strictly increasing"
+
+    t = time.perf_counter()
+    block = [i for _ in range(args.n // 10_000) for i in _default.next_block(10_000)]
+    dt = time.perf_counter() - t
+    print(f"next_block     {len(block) / dt:,.0f} ids/s")
+    assert ids[-1] < block[0] and block == sorted(block) and len(set(block)) == len(block), "blocks overlap"
+
+    per = args.n // args.threads
+    out = [None] * args.threads
+    def work(i): out[i] = burst(per)
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(args.threads)]
+    t = time.perf_counter()
+    for th in threads: th.start()
+    for th in threads: th.join()
+    dt = time.perf_counter() - t
+    every = [i for chunk in out for i in chunk]
+    print(f"{args.threads} threads      {len(every) / dt:,.0f} ids/s")
+    assert len(set(every)) == len(every), "duplicate IDs across threads"
+    assert all(c == sorted(c) for c in out), "IDs not increasing within a thread"
+
+    per = args.n // args.procs
+    with ProcessPoolExecutor(args.procs) as pool:
+        t = time.perf_counter()
+        chunks = list(pool.map(burst, [per] * args.procs))
+        dt = time.perf_counter() - t
+    every = [i for chunk in chunks for i in chunk]
+    print(f"{args.procs} processes    {len(every) / dt:,.0f} ids/s (including result transfer)")
+    assert len(set(every)) == len(every), "duplicate IDs across processes"
+    print(f"OK: {args.n:,} x 3 IDs unique")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Memory per transaction: list of dicts vs TxnColumns.
+
+    python benchmarks/bench_txnmem.py --rows 1000000
+
+Rows come from make_txn and are round-tripped through JSON, as they are when
+the JSON backend loads its snapshot (so every row owns its strings). Memory is
+measured with tracemalloc; the on-disk figure is the compact JSON the
+snapshot and journal write, which is the same for both representations.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ledger import make_txn
+from txncolumns import TxnColumns
+
+TYPES = ["deposit", "withdraw", "transfer_out", "transfer_in", "bill_pay", "qr_out", "qr_in"]
+CATS = ["Food", "Travel", "Bills", "Shopping", "Education", "Health", "Other", "Transfer", "Sales"]
+NOTES = ["Wallet Load", "Cash", "Payment", "QR Pay", "⚡ Electricity Bill", "Rent", "Dinner"]
+
+def synth_json(rows, users, seed=5):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(rows):
+        kind = rng.choice(TYPES)
+        corr = "TXN-0000000000000000000001" if kind.startswith(("transfer", "qr")) else None
+        out.append(make_txn(kind, rng.randint(100, 500_000) / 100, rng.choice(NOTES), rng.choice(CATS),
+                            f"user{rng.randrange(users)}", corr))
+    return json.dumps(out, separators=(",", ":"))
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    t = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - t
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size, elapsed
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=10_000)
+    args = ap.parse_args()
+
+    blob = synth_json(args.rows, args.users)
+    print(f"{args.rows:,} rows, {len(blob.encode()) / args.rows:.0f} B/txn as compact JSON on disk")
+    dicts, dict_bytes, t1 = measure(lambda: json.loads(blob))
+    cols, col_bytes, t2 = measure(lambda: TxnColumns(dicts))
+    print(f"list of dicts   {dict_bytes / args.rows:7.1f} B/txn  ({dict_bytes / 1e6:7.1f} MB, json.loads {t1:.2f} s)")
+    print(f"TxnColumns      {col_bytes / args.rows:7.1f} B/txn  ({col_bytes / 1e6:7.1f} MB, build {t2:.2f} s)")
+    print(f"reduction       x{dict_bytes / col_bytes:.1f}")
+
+    picks = min(100_000, len(cols))
+    for name, fn in (("iterate all rows", lambda: sum(1 for _ in cols)),
+                     (f"index {picks:,} random rows", lambda: [cols[i] for i in random.sample(range(len(cols)), picks)]),
+                     ("analytics_rows()", lambda: sum(1 for _ in cols.analytics_rows()))):
+        t = time.perf_counter(); fn(); print(f"{name:24s} {time.perf_counter() - t:6.2f} s")
+    assert cols[len(cols) // 2] == dicts[len(dicts) // 2]
+    assert json.dumps(list(cols), separators=(",", ":")) == blob
+
+if __name__ == "__main__":
+    main()
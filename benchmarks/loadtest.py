@@ -0,0 +1,159 @@
+"""
+Headless load test driving every wallet flow through the UI-free core.
+
+    python benchmarks/loadtest.py --sizes 1000 100000 1000000 --backend json
+    python benchmarks/loadtest.py --sizes 1000 --out bench_results/run.json
+    python benchmarks/loadtest.py --compare bench_results/old.json bench_results/new.json
+
+For each seeded synthetic population it times login, transfer, bill pay, QR
+pay, the first history page and the admin page, and reports throughput,
+p50/p95/p99 latency, bytes written per operation and peak RSS. Every
+population runs in a fresh process, so its peak RSS is its own and not the
+largest population's so far. Results are saved as JSON (with the git commit)
+so runs can be compared across commits.
+Login runs the real PIN KDF; set WALLET_PIN_COST to measure other costs.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ledger import Ledger, LedgerError
+from security import hash_pin
+from storage import JournalStore, SQLiteStore, create_record
+
+TYPES = ["deposit", "withdraw", "transfer_out", "transfer_in", "bill_pay", "qr_out", "qr_in"]
+TYPE_WEIGHTS = [15, 10, 25, 25, 10, 8, 7]
+CATS = ["Food", "Travel", "Bills", "Shopping", "Education", "Health", "Other"]
+PIN = "1234"
+
+def seed_population(store, users, txns_per_user, pin_hash, rng):
+    """Accounts with skewed (exponential) history lengths spread over a year."""
+    now = time.time()
+    chunk = []
+    for i in range(users):
+        n = min(int(rng.expovariate(1 / txns_per_user)), txns_per_user * 20)
+        stamps = sorted(now - rng.random() * 365 * 86400 for _ in range(n))
+        txns = []
+        for j, ts in enumerate(stamps):
+            kind = rng.choices(TYPES, TYPE_WEIGHTS)[0]
+            txns.append({"id": f"SEED-{i}-{j}", "timestamp": datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M"),
+                         "ts": ts, "type": kind, "amount": float(rng.randint(10, 5000)), "note": "seed",
+                         "category": rng.choice(CATS), "counterparty": f"user{rng.randrange(users)}"})
+        chunk.append(create_record(f"user{i}", {"pin": pin_hash, "balance": 1_000_000.0, "locked": False,
+                                                "is_verified": True, "enable_2fa": False,
+                                                "transactions": txns, "notifications": []}))
+        if len(chunk) == 1000: store.append(*chunk); chunk = []
+    store.append(*chunk)
+    store.flush()
+
+def disk_bytes(d):
+    return sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d))
+
+def run_flow(name, fn, ops, data_dir):
+    lat, errors = [], 0
+    before = disk_bytes(data_dir)
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        t = time.perf_counter()
+        try: fn()
+        except LedgerError: errors += 1
+        lat.append(time.perf_counter() - t)
+    wall = time.perf_counter() - t0
+    lat.sort()
+    q = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))] * 1e3
+    return {"flow": name, "ops": ops, "errors": errors, "ops_per_s": ops / wall,
+            "p50_ms": q(.5), "p95_ms": q(.95), "p99_ms": q(.99),
+            "bytes_written_per_op": (disk_bytes(data_dir) - before) / ops}
+
+def bench_population(users, args):
+    rng = random.Random(f"{args.seed}:{users}")
+    with tempfile.TemporaryDirectory() as d:
+        if args.backend == "json": store = JournalStore(os.path.join(d, "wallet.json"))
+        else: store = SQLiteStore(os.path.join(d, "wallet.db"))
+        t = time.perf_counter()
+        seed_population(store, users, args.txns_per_user, hash_pin(PIN), rng)
+        seed_s = time.perf_counter() - t
+        t = time.perf_counter()
+        ledger = Ledger(store)
+        open_s = time.perf_counter() - t
+
+        pick = lambda: f"user{rng.randrange(users)}"
+        def pair():
+            a = rng.randrange(users); b = (a + 1 + rng.randrange(users - 1)) % users
+            return f"user{a}", f"user{b}"
+        flows = [
+            ("login", lambda: ledger.authenticate(pick(), PIN), args.login_ops),
+            ("transfer", lambda: ledger.transfer(*pair(), 25.0, "Load test"), args.ops),
+            ("bill_pay", lambda: ledger.pay_bill(pick(), 99.0, "⚡ Electricity Bill"), args.ops),
+            ("qr_pay", lambda: ledger.qr_pay(*pair(), 10.0, "Food"), args.ops),
+            ("history", lambda: store.query_transactions(pick(), limit=50), args.ops),
+            ("admin", lambda: (ledger.system.transactions, store.account_page(None, 50)), args.ops),
+        ]
+        results = [run_flow(name, fn, ops, d) for name, fn, ops in flows]
+        ledger.close()
+    return {"users": users, "seed_s": seed_s, "open_s": open_s,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "flows": results}
+
+def git_commit():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def print_run(run):
+    print(f"\n== {run['users']:,} users: seeded in {run['seed_s']:.1f} s, opened in {run['open_s']:.2f} s, "
+          f"peak RSS {run['peak_rss_mb']:.0f} MB")
+    print(f"{'flow':10s} {'ops/s':>10s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'B/op':>9s} {'errors':>7s}")
+    for f in run["flows"]:
+        print(f"{f['flow']:10s} {f['ops_per_s']:10,.0f} {f['p50_ms']:9.3f} {f['p95_ms']:9.3f} {f['p99_ms']:9.3f} "
+              f"{f['bytes_written_per_op']:9.0f} {f['errors']:7d}")
+
+def compare(old_path, new_path):
+    old, new = (json.load(open(p)) for p in (old_path, new_path))
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    old_runs = {r["users"]: {f["flow"]: f for f in r["flows"]} for r in old["runs"]}
+    for run in new["runs"]:
+        for f in run["flows"]:
+            o = old_runs.get(run["users"], {}).get(f["flow"])
+            if o: print(f"{run['users']:>9,} {f['flow']:10s} ops/s x{f['ops_per_s'] / o['ops_per_s']:5.2f}  "
+                        f"p99 {o['p99_ms']:8.3f} -> {f['p99_ms']:8.3f} ms")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000, 1_000_000])
+    ap.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    ap.add_argument("--txns-per-user", type=int, default=10)
+    ap.add_argument("--ops", type=int, default=2000)
+    ap.add_argument("--login-ops", type=int, default=50, help="login runs the full PIN KDF")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="JSON results file (default bench_results/<time>-<commit>.json)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = ap.parse_args()
+    if args.compare: return compare(*args.compare)
+
+    runs = []
+    for users in args.sizes:
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            runs.append(pool.submit(bench_population, users, args).result())
+        print_run(runs[-1])
+    commit = git_commit()
+    out = args.out or os.path.join("bench_results", f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"commit": commit, "python": platform.python_version(), "backend": args.backend,
+                   "args": vars(args), "runs": runs}, f, indent=2)
+    print(f"\nSaved {out}")
+
+if __name__ == "__main__":
+    main()
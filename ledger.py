@@ -0,0 +1,342 @@
+"""
+Process-wide ledger for SkyWallet Pro
+-------------------------------------------------------
+One Ledger per server process is shared by every Streamlit session, so
+sessions only keep their own UI state (current user, form steps) and always
+see each other's writes. Account headers live in memory; transaction and
+notification rows stay in the storage backend.
+
+All five money paths (deposit, withdraw, bill pay, transfer, QR pay) go
+through `Ledger._move`, which checks and applies a movement while holding the
+locks of every account involved (taken in sorted order, so two opposite
+transfers can never deadlock); on a shared, sharded store (sharding.py) they
+extend to the shards' lock files. An optional idempotency key makes a retried
+submit return the original result instead of moving money twice. Per-account
+aggregates (aggregates.py) are built from history on first use and then kept
+up to date as transactions are applied, as are the system-wide counters
+shown on the admin page; `subscribe` hands every new transaction to
+background consumers such as the risk scorer (scoring.py). Inside
+`Ledger.atomic(*users)` the calling thread's records are buffered and
+persisted with a single store append before those users' locks are released;
+`Ledger.batch()` buffers across many accounts without holding their locks and
+is only for a ledger nobody else is writing to (a standalone import).
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+import perf
+from aggregates import AccountAggregates, SystemCounters
+from security import hash_pin, needs_rehash, verify_pin
+from storage import apply_record, create_record, notify_record, set_record, txn_record
+from txnid import new_txn_id
+
+IDEMPOTENCY_CACHE = 100_000
+MAX_AMOUNT = 1e12  # per movement: balances stay far from float overflow
+
+class LedgerError(Exception):
+    """A money movement was rejected; the message is safe to show to the user."""
+
+_stamp_cache = (None, "", "")
+
+def _stamps(now=None):
+    """(epoch second, "%Y-%m-%d %H:%M", "%H:%M"), formatted at most once per second."""
+    global _stamp_cache
+    sec = int(time.time() if now is None else now)
+    if _stamp_cache[0] != sec:
+        now = datetime.fromtimestamp(sec)
+        _stamp_cache = (sec, now.strftime("%Y-%m-%d %H:%M"), now.strftime("%H:%M"))
+    return _stamp_cache
+
+def make_txn(txn_type, amount, note, category, counterparty, corr=None, now=None):
+    sec, stamp, _ = _stamps(now)
+    txn = {
+        "id": new_txn_id(),
+        "timestamp": stamp,
+        "ts": sec,
+        "type": txn_type,
+        "amount": float(round(amount, 2)),
+        "note": note,
+        "category": category,
+        "counterparty": counterparty,
+    }
+    if corr: txn["corr"] = corr  # shared by both legs of a transfer / QR payment
+    return txn
+
+def consumer_no_error(consumer_no):
+    if not consumer_no: return "Enter Consumer Number"
+    if not consumer_no.isdigit(): return "❌ Invalid Format: Consumer Number must contain only digits (0-9)."
+    return None
+
+def amount_error(amount):
+    if type(amount) not in (int, float) or not math.isfinite(amount): return "Invalid Amount"  # not bool
+    if not 0 < amount <= MAX_AMOUNT: return "Invalid Amount"
+    return None
+
+def check_amount(amount):
+    # Before any record is built: make_txn rounds the amount, which fails on non-numbers.
+    err = amount_error(amount)
+    if err: raise LedgerError(err)
+
+def add_notification(username, message, now=None):
+    return notify_record(username, {"time": _stamps(now)[2], "msg": message})
+
+class Ledger:
+    def __init__(self, store, clock=None):
+        self.store = store
+        self.clock = clock  # anything with now(); None: wall-clock time (scheduler.SimulatedClock for replays)
+        self.accounts = store.load()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._idem = OrderedDict()
+        self._idem_guard = threading.Lock()
+        self._batch = threading.local()
+        self._aggregates = {}
+        self._versions = {}  # user (None: everyone) -> bumped on every txn/create
+        self._txn_hooks = []
+        self.system = SystemCounters(self.accounts, *store.txn_rollup())
+        self._system_guard = threading.Lock()
+
+    def account(self, user):
+        if self.store.shared:
+            with self.locked(user): pass  # picks up other processes' changes
+        return self.accounts.get(user)
+
+    def __contains__(self, user):
+        return self.account(user) is not None
+
+    def aggregates(self, user):
+        """Rolling aggregates of `user`, built from the stored history once."""
+        agg = self._aggregates.get(user)
+        if agg is None:
+            with self.locked(user):
+                agg = self._aggregates.get(user)
+                if agg is None:
+                    agg = self._aggregates[user] = AccountAggregates.from_transactions(self.store.transactions(user))
+        return agg
+
+    def rebuild_aggregates(self, counts=None):
+        """Recompute every account's aggregates from raw history; returns users whose cached ones differed.
+
+        Only accounts that had aggregates cached keep the rebuilt ones; the others are
+        checked and dropped again, so a rebuild does not hold every account in memory.
+        `counts`, if given, receives the transaction counts by type over all accounts.
+        """
+        drifted = []
+        for user in list(self.accounts):
+            with self.locked(user):
+                fresh = AccountAggregates.from_transactions(self.store.transactions(user))
+                cached = self._aggregates.get(user)
+                if cached is not None:
+                    if fresh.to_dict() != cached.to_dict(): drifted.append(user)
+                    self._aggregates[user] = fresh
+            if counts is not None:
+                for kind, n in fresh.count_by_type.items(): counts[kind] = counts.get(kind, 0) + n
+        return drifted
+
+    def subscribe(self, hook):
+        """Call hook(user, txn) for every transaction applied from now on.
+
+        Hooks run on the writer's thread while its account locks are held, so
+        they must only hand the row off (e.g. a queue put), never process it.
+        """
+        self._txn_hooks.append(hook)
+
+    def txn_version(self, user=None):
+        """Changes whenever `user`'s transactions (or, for None, anyone's) change."""
+        return self._versions.get(user, 0)
+
+    def authenticate(self, user, pin):
+        """Full PIN check for login; upgrades outdated hashes on success."""
+        acc = self.account(user)
+        if not acc: raise LedgerError("User not found.")
+        if acc.get("locked"): raise LedgerError("Account Locked.")
+        if not verify_pin(pin, acc["pin"]): return False
+        if needs_rehash(acc["pin"]): self.commit(set_record(user, pin=hash_pin(pin)))
+        return True
+
+    def total_funds(self):
+        return self.system.total_funds
+
+    def lock_for(self, user):
+        lock = self._locks.get(user)
+        if lock is not None: return lock
+        with self._locks_guard:
+            lock = self._locks.get(user)
+            if lock is None: lock = self._locks[user] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def locked(self, *users):
+        """Hold the locks of `users`, always acquired in sorted order.
+
+        On a shared store the users' shard file locks are held too, and their
+        cached headers are re-read first, so checks see other processes' writes.
+        Inside `batch` nothing else writes, so no per-user lock is taken at all.
+        """
+        if getattr(self._batch, "sole_writer", False):
+            yield; return
+        locks = [self.lock_for(u) for u in sorted(set(users))]
+        for lock in locks: lock.acquire()
+        try:
+            with self.store.exclusive(*users):
+                # Inside `atomic` the cache is ahead of the store: it was refreshed on entry.
+                if self.store.shared and getattr(self._batch, "records", None) is None: self._refresh(users)
+                yield
+        finally:
+            for lock in reversed(locks): lock.release()
+
+    def _refresh(self, users):
+        for user in users:
+            fresh, cached = self.store.get_account(user), self.accounts.get(user)
+            if fresh == cached: continue
+            with self._system_guard:
+                self.system.total_funds += (fresh or {}).get("balance", 0.0) - (cached or {}).get("balance", 0.0)
+                self.system.users += (fresh is not None) - (cached is not None)
+                self._versions[user] = self._versions.get(user, 0) + 1
+                self._versions[None] = self._versions.get(None, 0) + 1
+            if fresh is None: self.accounts.pop(user, None)
+            else: self.accounts[user] = fresh
+            self._aggregates.pop(user, None)  # rebuilt from the store on next use
+
+    def create_account(self, user, account):
+        """Create `user` from a full account dict, unless another session took the name first."""
+        with self.locked(user):
+            if user in self.accounts: raise LedgerError(f"Username '{user}' taken.")
+            self.commit(create_record(user, account))
+
+    def commit(self, *records):
+        """Persist mutation records, then apply them to the shared headers."""
+        with self.locked(*(r["user"] for r in records)):
+            buffered = getattr(self._batch, "records", None)
+            if buffered is not None: buffered.extend(records)
+            else: self._persist(records)
+            self._apply(records)
+
+    @contextmanager
+    def atomic(self, *users):
+        """Hold `users`' locks; what this thread writes for them is persisted in one append before release."""
+        with self.locked(*users):
+            if getattr(self._batch, "records", None) is not None:
+                yield; return
+            self._batch.records = []
+            try: yield
+            finally: self._flush_batch()
+
+    @contextmanager
+    def batch(self):
+        """Buffer this thread's movements and commits and persist them in one append.
+
+        Changes are visible in memory before they are stored, and per-user locks
+        are skipped, so only use it when no other thread or process writes to
+        the ledger meanwhile; in a shared server process use `atomic`.
+        """
+        if getattr(self._batch, "records", None) is not None or self.store.shared:
+            yield; return  # shared stores: a write must land before its locks are released
+        self._batch.records, self._batch.sole_writer = [], True
+        try: yield
+        finally:
+            self._batch.sole_writer = False
+            self._flush_batch()
+
+    def _flush_batch(self):
+        records, self._batch.records = self._batch.records, None
+        if records: self._persist(records)
+
+    def _persist(self, records):
+        with perf.span("store.append"): self.store.append(*records)
+        perf.count("store.records", len(records))
+
+    def _now(self):
+        return self.clock.now() if self.clock else None
+
+    def close(self):
+        self.store.flush()
+        self.store.close()
+
+    # --- money movement ---
+    def deposit(self, user, amount, note="Wallet Load", category="Other", counterparty="Bank", idem_key=None):
+        check_amount(amount)
+        txn = make_txn("deposit", amount, note, category, counterparty, now=self._now())
+        return self._move(None, user, amount, [txn_record(user, amount, txn)], idem_key)
+
+    def withdraw(self, user, amount, note="Cash", category="Other", counterparty="ATM", idem_key=None):
+        check_amount(amount)
+        txn = make_txn("withdraw", amount, note, category, counterparty, now=self._now())
+        return self._move(user, None, amount, [txn_record(user, -amount, txn)], idem_key)
+
+    def pay_bill(self, user, amount, biller, idem_key=None):
+        check_amount(amount)
+        now = self._now()
+        txn = make_txn("bill_pay", amount, biller, "Bills", "Utility", now=now)
+        notice = add_notification(user, f"Paid {biller} of ₹{amount}", now=now)
+        return self._move(user, None, amount, [txn_record(user, -amount, txn), notice], idem_key)
+
+    def transfer(self, src, dst, amount, note="Payment", idem_key=None):
+        check_amount(amount)
+        now = self._now()
+        corr = new_txn_id()
+        out = make_txn("transfer_out", amount, note, "Transfer", dst, corr, now=now)
+        records = [txn_record(src, -amount, out),
+                   txn_record(dst, amount, make_txn("transfer_in", amount, note, "Uncategorized", src, corr, now=now)),
+                   add_notification(dst, f"Received ₹{amount} from {src}", now=now)]
+        return self._move(src, dst, amount, records, idem_key)
+
+    def qr_pay(self, src, dst, amount, category="Other", idem_key=None):
+        check_amount(amount)
+        now = self._now()
+        corr = new_txn_id()
+        out = make_txn("qr_out", amount, "QR Pay", category, dst, corr, now=now)
+        records = [txn_record(src, -amount, out),
+                   txn_record(dst, amount, make_txn("qr_in", amount, "QR Pay", "Sales", src, corr, now=now)),
+                   add_notification(dst, f"QR Payment: Received ₹{amount} from {src}", now=now)]
+        return self._move(src, dst, amount, records, idem_key)
+
+    @perf.timed("ledger.move")
+    def _move(self, src, dst, amount, records, idem_key):
+        """Validate and apply one movement atomically; returns the first txn."""
+        users = [u for u in (src, dst) if u is not None]
+        with self.locked(*users):
+            if idem_key is not None:
+                with self._idem_guard:
+                    if idem_key in self._idem:
+                        perf.count("ledger.idempotent_replays")
+                        return self._idem[idem_key]
+            for u in users:
+                if u not in self.accounts: raise LedgerError("User not found")
+            if src is not None and src == dst: raise LedgerError("Self transfer not allowed")
+            if src is not None:
+                if self.accounts[src].get("locked"): raise LedgerError("Account Locked")
+                if self.accounts[src]["balance"] < amount: raise LedgerError("Insufficient Balance")
+            buffered = getattr(self._batch, "records", None)
+            if buffered is not None: buffered.extend(records)
+            else: self._persist(records)
+            self._apply(records)
+            result = records[0]["txn"]
+            if idem_key is not None:
+                with self._idem_guard:
+                    self._idem[idem_key] = result
+                    if len(self._idem) > IDEMPOTENCY_CACHE: self._idem.popitem(last=False)
+            return result
+
+    def _apply(self, records):
+        for rec in records:
+            existed = rec["user"] in self.accounts
+            apply_record(self.accounts, rec, headers=True)  # histories stay in the store
+            if rec["op"] in ("txn", "create"):
+                self._versions[rec["user"]] = self._versions.get(rec["user"], 0) + 1
+                with self._system_guard: self._versions[None] = self._versions.get(None, 0) + 1
+            if rec["op"] == "txn":
+                for hook in self._txn_hooks: hook(rec["user"], rec["txn"])
+            if rec["op"] == "txn" and existed:
+                agg = self._aggregates.get(rec["user"])
+                if agg is not None: agg.add(rec["txn"])
+                with self._system_guard: self.system.add_txn(rec["delta"], rec["txn"])
+            elif rec["op"] == "create":
+                self._aggregates.pop(rec["user"], None)
+                if not existed:
+                    with self._system_guard: self.system.add_account(rec["account"])
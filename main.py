@@ -8,21 +8,29 @@ Guided By:   Sanket Dodya Sir
 Features:
 - 🔢 Strict Numeric Check for Bill Payments
 - 💡 Bill Payments, Notifications, Credit Score
-- 🔒 SHA-256 Security & Auto-Clear
+- 🔒 Salted PIN Hashing (PBKDF2 / scrypt) & Auto-Clear
 - 🎨 Premium Dark UI
 """
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 import json
 import time
 import random
 from datetime import datetime
 import os
-import pandas as pd
-import qrcode
-import hashlib
-import plotly.express as px
-from io import BytesIO
+import sys
+import atexit
+import threading
+import uuid
+import perf
+import reports
+from security import STEP_UP, hash_pin
+from ledger import Ledger, LedgerError, MAX_AMOUNT, amount_error, make_txn, consumer_no_error
+from storage import open_store, set_record, clear_notifications_record, read_notifications_record
+
+# pandas, plotly and qrcode (via qrcache) are imported inside the pages that
+# use them, so the login screen and a cold pod don't pay for them.
 
 # ---------------------------------------------------------
 # 1. PAGE CONFIGURATION
@@ -95,14 +103,23 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-DB_FILE = "wallet_data.json"
 CATEGORIES = ["Food", "Travel", "Bills", "Shopping", "Education", "Health", "Other"]
+BILLERS = ["📱 Mobile Recharge", "⚡ Electricity Bill", "📺 DTH / Cable", "🌐 Broadband"]
+TXN_TYPES = ["deposit", "withdraw", "transfer_out", "transfer_in", "bill_pay", "qr_out", "qr_in"]
+HISTORY_PAGE = 50
+ADMIN_PAGE = 50
+NOTIF_PAGE = 20
 
 # ---------------------------------------------------------
 # 3. DATA & SECURITY LOGIC
 # ---------------------------------------------------------
-def hash_pin(pin):
-    return hashlib.sha256(pin.encode()).hexdigest()
+def session_token():
+    if "sid" not in st.session_state: st.session_state.sid = uuid.uuid4().hex
+    return st.session_state.sid
+
+def check_pin(user, pin):
+    # Step-up cache: the KDF runs once per session every few minutes, not on every form.
+    return STEP_UP.verify(session_token(), user, pin, get_ledger().account(user)["pin"])
 
 def default_accounts():
     h1 = hash_pin("1111")
@@ -114,27 +131,53 @@ def default_accounts():
         "admin": {"pin": admin, "balance": 0.0, "locked": False, "is_verified": True, "enable_2fa": False, "transactions": [], "notifications": []} 
     }
 
-def load_accounts():
-    if os.path.exists(DB_FILE):
-        try:
-            with open(DB_FILE, "r") as f:
-                data = json.load(f)
-                accs = data.get("accounts", default_accounts())
-                for u in accs:
-                    if "notifications" not in accs[u]: accs[u]["notifications"] = []
-                    if "is_verified" not in accs[u]: accs[u]["is_verified"] = False
-                return accs
-        except: pass
-    return default_accounts()
-
-def save_accounts():
-    try:
-        with open(DB_FILE, "w") as f:
-            json.dump({"accounts": st.session_state.accounts}, f, indent=2)
+@st.cache_resource(show_spinner=False)  # also called from start_worker's thread: no elements from there
+def get_ledger():
+    # One ledger per server process, shared by every browser session.
+    with perf.span("ledger.open"): ledger = Ledger(open_store(default=default_accounts))
+    atexit.register(ledger.close)
+    return ledger
+
+@st.cache_resource
+def get_analytics():
+    import analytics
+    return analytics.Analytics(get_ledger())
+
+@st.cache_resource
+def get_scorer():
+    # Risk features follow every write on a background thread (see scoring.py). Started on
+    # first use (dashboard score, admin alerts); its backfill replays what was written before.
+    import scoring
+    return scoring.Scorer(get_ledger()).start()
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    # Standing instructions run on a server thread that keeps running whether or not anyone
+    # is logged in (started by start_worker).
+    import scheduler
+    sched = scheduler.Scheduler(get_ledger())
+    if os.environ.get("WALLET_SCHEDULER", "on") != "off": sched.start()
+    return sched
+
+@st.cache_resource
+def start_worker():
+    # Once per server process, on the first page view after a (re)start: opens the ledger and
+    # starts the scheduler off the script thread, so the login page renders while the store loads.
+    t = threading.Thread(target=get_scheduler, name="wallet-startup", daemon=True)
+    add_script_run_ctx(t)
+    t.start()
+    return t
+
+def get_store():
+    return get_ledger().store
+
+@perf.timed()
+def save_accounts(*records):
+    # Each record is one mutation (see storage.py); only the change is journaled.
+    try: get_ledger().commit(*records)
     except Exception as e: st.error(f"DB Error: {e}")
 
 def init_state():
-    if "accounts" not in st.session_state: st.session_state.accounts = load_accounts()
     if "current_user" not in st.session_state: st.session_state.current_user = None
     if "login_attempts" not in st.session_state: st.session_state.login_attempts = {}
     if "signup_step" not in st.session_state: st.session_state.signup_step = 1
@@ -152,35 +195,36 @@ def check_timeout():
             st.rerun()
         else: st.session_state.last_active = time.time()
 
-def make_txn(txn_type, amount, note, category, counterparty):
-    return {
-        "id": f"TXN-{int(time.time())}",
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "type": txn_type,
-        "amount": float(round(amount, 2)),
-        "note": note,
-        "category": category,
-        "counterparty": counterparty,
-    }
+def idem_slot(form, inputs):
+    # One key per distinct submission: it only changes with the inputs, so a double click or
+    # a resubmitted form replays the first payment instead of making a second one.
+    slot = st.session_state.get(f"idem_{form}")
+    if slot is None or slot["inputs"] != inputs:
+        slot = st.session_state[f"idem_{form}"] = {"inputs": inputs, "key": uuid.uuid4().hex, "txn": None}
+    return slot
 
-def add_notification(username, message):
-    if username in st.session_state.accounts:
-        notif = {"time": datetime.now().strftime("%H:%M"), "msg": message}
-        st.session_state.accounts[username]["notifications"].insert(0, notif)
+def move_money(form, op, *args, **kwargs):
+    slot = idem_slot(form, (args, sorted(kwargs.items())))
+    try:
+        txn = op(*args, idem_key=slot["key"], **kwargs)
+    except LedgerError as e: perf.count("ledger.rejected"); st.error(str(e)); return None
+    except Exception as e: st.error(f"DB Error: {e}"); return None
+    if txn["id"] == slot["txn"]:
+        st.warning("Already done: this exact payment was just made. Change the amount or details to make another.")
+        return None
+    slot["txn"] = txn["id"]
+    return txn
 
-def compute_credit_score(acc):
-    score = 600 + int(acc['balance'] / 100)
-    return min(score, 850)
+def compute_credit_score(user, acc):
+    return get_scorer().credit_score(user, acc["balance"])
 
-def get_recent_contacts(acc):
-    contacts = set()
-    for tx in acc.get("transactions", []):
-        if tx["type"] in ["transfer_out", "qr_out"]: contacts.add(tx["counterparty"])
-    return sorted(list(contacts))
+def get_recent_contacts(user):
+    return get_store().counterparties(user, ("transfer_out", "qr_out"))
 
 # ---------------------------------------------------------
 # 4. AUTHENTICATION UI
 # ---------------------------------------------------------
+@perf.timed()
 def ui_create_account():
     st.subheader("📝 Create New Account")
     st.markdown('<div class="stat-card" style="padding:10px; border-left:4px solid #3b82f6; margin-bottom:20px;">💡 <b>Tip:</b> Use <b>TAB</b> to switch boxes. <b>ENTER</b> to submit.</div>', unsafe_allow_html=True)
@@ -193,15 +237,16 @@ def ui_create_account():
                 c1, c2 = st.columns(2)
                 with c1: p = st.text_input("Set PIN (4 digits)", type="password", max_chars=4)
                 with c2: cp = st.text_input("Confirm PIN", type="password", max_chars=4)
-                bal = st.number_input("Initial Deposit", min_value=0.0, step=100.0)
+                bal = st.number_input("Initial Deposit", min_value=0.0, max_value=MAX_AMOUNT, step=100.0)
                 
                 if st.form_submit_button("Get Verification Code"):
                     u = u.strip().lower()
                     if not u or " " in u: st.error("Invalid Username.")
-                    elif u in st.session_state.accounts: st.warning(f"Username '{u}' taken.")
+                    elif u in get_ledger(): st.warning(f"Username '{u}' taken.")
                     elif len(mob)!=10 or not mob.isdigit(): st.error("Invalid Mobile Number (Digits Only).")
                     elif len(p)!=4 or not p.isdigit(): st.error("PIN must be 4 digits.")
                     elif p!=cp: st.error("PINs do not match.")
+                    elif bal and amount_error(bal): st.error("Invalid Amount")
                     else:
                         st.session_state.signup_data = {"u":u, "p":hash_pin(p), "bal":bal}
                         st.session_state.generated_otp = str(random.randint(1000, 9999))
@@ -218,11 +263,14 @@ def ui_create_account():
                         d = st.session_state.signup_data
                         txns = []
                         if d["bal"]>0: txns.append(make_txn("deposit", d["bal"], "Opening Balance", "Other", "Self"))
-                        st.session_state.accounts[d["u"]] = {
-                            "pin": d["p"], "balance": d["bal"], "locked": False, 
-                            "is_verified": True, "enable_2fa": False, "transactions": txns, "notifications": []
-                        }
-                        save_accounts()
+                        try:
+                            get_ledger().create_account(d["u"], {
+                                "pin": d["p"], "balance": d["bal"], "locked": False,
+                                "is_verified": True, "enable_2fa": False, "transactions": txns, "notifications": []
+                            })
+                        except LedgerError as e:  # taken by another session since step 1
+                            st.session_state.signup_step = 1
+                            st.warning(str(e)); st.stop()
                         st.session_state.current_user = d["u"]
                         st.session_state.login_attempts[d["u"]] = 0
                         st.session_state.signup_step = 1
@@ -230,6 +278,7 @@ def ui_create_account():
                         time.sleep(0.5); st.rerun()
                     else: st.error("Invalid OTP")
 
+@perf.timed()
 def ui_login():
     st.subheader("🔐 Secure Login")
     with st.container(border=True):
@@ -238,27 +287,29 @@ def ui_login():
             p = st.text_input("PIN", type="password", max_chars=4)
             if st.form_submit_button("👉 Login"):
                 u = u.strip().lower()
-                acc = st.session_state.accounts.get(u)
-                if not acc: st.error("User not found.")
-                elif acc.get("locked"): st.error("Account Locked.")
-                elif acc["pin"] == hash_pin(p):
+                try: ok = get_ledger().authenticate(u, p)
+                except LedgerError as e: st.error(str(e)); ok = None
+                if ok:
+                    STEP_UP.remember(session_token(), u, p, get_ledger().account(u)["pin"])
                     st.session_state.current_user = u
                     st.session_state.login_attempts[u] = 0
                     st.success("Welcome back!"); time.sleep(0.5); st.rerun()
-                else:
+                elif ok is False:
                     fails = st.session_state.login_attempts.get(u, 0) + 1
                     st.session_state.login_attempts[u] = fails
                     if fails >= 3:
-                        acc["locked"] = True; save_accounts(); st.error("Locked.")
+                        save_accounts(set_record(u, locked=True)); st.error("Locked.")
                     else: st.warning(f"Wrong PIN. Tries left: {3-fails}")
 
 # ---------------------------------------------------------
 # 5. CORE FEATURES
 # ---------------------------------------------------------
+@perf.timed()
 def ui_dashboard():
+    import pandas as pd
     user = st.session_state.current_user
-    acc = st.session_state.accounts[user]
-    score = compute_credit_score(acc)
+    acc = get_ledger().account(user)
+    score = compute_credit_score(user, acc)
     
     c1, c2 = st.columns([3, 1])
     with c1: st.title(f"👋 Hello, {user.capitalize()}")
@@ -281,31 +332,46 @@ def ui_dashboard():
         """, unsafe_allow_html=True)
 
     st.markdown("### 📉 Recent Transactions")
-    df = pd.DataFrame(acc["transactions"])
+    with perf.span("dashboard.dataframe"): df = pd.DataFrame(list(reversed(get_ledger().aggregates(user).recent)))
     if not df.empty:
-        st.dataframe(df[['timestamp', 'type', 'amount', 'note']].tail(5).sort_values('timestamp', ascending=False), use_container_width=True, hide_index=True)
+        st.dataframe(df[['timestamp', 'type', 'amount', 'note']], use_container_width=True, hide_index=True)
     else: st.info("No recent activity.")
 
+@perf.timed()
 def ui_notifications():
     st.header("🔔 Notifications")
     user = st.session_state.current_user
-    notifs = st.session_state.accounts[user].get("notifications", [])
+    page = st.session_state.get("notif_page", 0)
+    notifs = get_store().notifications(user, page * NOTIF_PAGE, NOTIF_PAGE + 1)
     
     if notifs:
-        if st.button("Clear All"):
-            st.session_state.accounts[user]["notifications"] = []
-            save_accounts(); st.rerun()
-        for n in notifs:
+        c1, c2 = st.columns(2)
+        with c1:
+            if get_ledger().account(user).get("unread") and st.button("Mark All Read"):
+                save_accounts(read_notifications_record(user)); st.rerun()
+        with c2:
+            if st.button("Clear All"):
+                st.session_state.notif_page = 0
+                save_accounts(clear_notifications_record(user)); st.rerun()
+        for n in notifs[:NOTIF_PAGE]:
             st.info(f"**{n['time']}** - {n['msg']}")
+        c1, c2, c3 = st.columns([1, 2, 1])
+        with c1:
+            if page > 0 and st.button("⬅️ Newer"): st.session_state.notif_page = page - 1; st.rerun()
+        with c2: st.caption(f"Page {page + 1}")
+        with c3:
+            if len(notifs) > NOTIF_PAGE and st.button("Older ➡️"): st.session_state.notif_page = page + 1; st.rerun()
+    elif page > 0:
+        st.session_state.notif_page = 0; st.rerun()
     else:
         st.success("No new notifications.")
 
+@perf.timed()
 def ui_bill_pay():
     st.header("💡 Bill Payments")
     user = st.session_state.current_user
-    acc = st.session_state.accounts[user]
     
-    bill_type = st.selectbox("Select Biller", ["📱 Mobile Recharge", "⚡ Electricity Bill", "📺 DTH / Cable", "🌐 Broadband"])
+    bill_type = st.selectbox("Select Biller", BILLERS)
     
     with st.container(border=True):
         with st.form("bill_pay", clear_on_submit=True):
@@ -316,25 +382,19 @@ def ui_bill_pay():
             
             if st.form_submit_button(f"Pay {bill_type}"):
                 # --- FIX: Strict Validation Check ---
-                if not consumer_no: st.error("Enter Consumer Number")
-                elif not consumer_no.isdigit(): st.error("❌ Invalid Format: Consumer Number must contain only digits (0-9).")
+                if consumer_no_error(consumer_no): st.error(consumer_no_error(consumer_no))
                 elif amt <= 0: st.error("Invalid Amount")
-                elif hash_pin(pin) != acc["pin"]: st.error("Wrong PIN")
-                elif acc["balance"] < amt: st.error("Insufficient Balance")
-                else:
-                    acc["balance"] -= amt
-                    acc["transactions"].append(make_txn("bill_pay", amt, bill_type, "Bills", "Utility"))
-                    add_notification(user, f"Paid {bill_type} of ₹{amt}")
-                    save_accounts()
+                elif not check_pin(user, pin): st.error("Wrong PIN")
+                elif move_money("bill_pay", get_ledger().pay_bill, user, amt, bill_type):
                     st.balloons()
                     st.success(f"✅ {bill_type} Successful!")
 
+@perf.timed()
 def ui_transfer():
     st.header("💸 Transfer (UPI)")
     user = st.session_state.current_user
-    acc = st.session_state.accounts[user]
     
-    contacts = get_recent_contacts(acc)
+    contacts = get_recent_contacts(user)
     selected = ""
     if contacts:
         opt = ["-- Select Contact --"] + contacts
@@ -350,40 +410,75 @@ def ui_transfer():
             
             if st.form_submit_button("Send Money"):
                 rec = to.strip().lower()
-                if not rec or rec not in st.session_state.accounts: st.error("User not found")
+                if not rec or rec not in get_ledger(): st.error("User not found")
                 elif rec == user: st.error("Self transfer not allowed")
                 elif amt <= 0: st.error("Invalid Amount")
-                elif acc["balance"] < amt: st.error("Low Balance")
-                elif hash_pin(pin) != acc["pin"]: st.error("Wrong PIN")
-                else:
-                    acc["balance"] -= amt
-                    acc["transactions"].append(make_txn("transfer_out", amt, note, "Transfer", rec))
-                    st.session_state.accounts[rec]["balance"] += amt
-                    st.session_state.accounts[rec]["transactions"].append(make_txn("transfer_in", amt, note, "Uncategorized", user))
-                    add_notification(rec, f"Received ₹{amt} from {user}")
-                    save_accounts()
+                elif not check_pin(user, pin): st.error("Wrong PIN")
+                elif move_money("transfer", get_ledger().transfer, user, rec, amt, note):
                     st.success(f"✅ Sent ₹{amt} to {rec}")
 
+@perf.timed()
+def ui_scheduled():
+    st.header("🗓️ Scheduled Payments")
+    user = st.session_state.current_user
+    sched = get_scheduler()
+
+    kind = st.radio("Type", ["Transfer", "Bill Payment"], horizontal=True)
+    with st.container(border=True):
+        with st.form("scheduled", clear_on_submit=True):
+            if kind == "Transfer":
+                to, consumer_no = st.text_input("Receiver Username").strip().lower(), None
+            else:
+                to = st.selectbox("Select Biller", BILLERS)
+                consumer_no = st.text_input("Consumer Number / Mobile No", help="Enter numbers only")
+            amt = st.number_input("Amount (₹)", min_value=0.0, step=10.0)
+            c1, c2, c3 = st.columns(3)
+            with c1: day = st.date_input("First payment on", value=datetime.now().date())
+            with c2: at = st.time_input("At", value=datetime.now().replace(second=0, microsecond=0).time())
+            with c3: repeat = st.selectbox("Repeat", ["once", "daily", "weekly", "monthly"], format_func=str.title)
+            note = st.text_input("Note", value="Payment") if kind == "Transfer" else ""
+            pin = st.text_input("Confirm PIN", type="password", max_chars=4)
+
+            if st.form_submit_button("Schedule"):
+                if not check_pin(user, pin): st.error("Wrong PIN")
+                else:
+                    first = datetime.combine(day, at).timestamp()
+                    try:
+                        sched.add(user, "transfer" if kind == "Transfer" else "bill", to, amt, first, repeat, note, consumer_no)
+                        st.success(f"✅ Scheduled {repeat} payment of ₹{amt} to {to}")
+                    except LedgerError as e: st.error(str(e))
+
+    st.subheader("Your Instructions")
+    items = [i for i in sched.instructions(user) if i["active"]]
+    if not items: st.info("No scheduled payments.")
+    for ins in items:
+        c1, c2 = st.columns([5, 1])
+        with c1:
+            st.markdown(f"**₹{ins['amount']}** → {ins['to']} · {ins['repeat'].title()} · "
+                        f"next {datetime.fromtimestamp(ins['next']):%d %b %Y %H:%M}")
+            if ins["last_error"]: st.caption(f"⚠️ Last attempt: {ins['last_error']} (retry {ins['retries']})")
+        with c2:
+            if st.button("Cancel", key=f"cancel_{ins['id']}"):
+                sched.cancel(user, ins["id"]); st.rerun()
+
+@perf.timed()
 def ui_deposit():
     st.header("📥 Add Money")
     user = st.session_state.current_user
-    acc = st.session_state.accounts[user]
     with st.container(border=True):
         with st.form("deposit", clear_on_submit=True):
             amt = st.number_input("Amount (₹)", min_value=0.0, step=100.0)
             pin = st.text_input("Confirm PIN", type="password", max_chars=4)
             if st.form_submit_button("Deposit"):
                 if amt <= 0: st.error("Invalid Amount")
-                elif hash_pin(pin) != acc["pin"]: st.error("Wrong PIN")
-                else:
-                    acc["balance"] += amt
-                    acc["transactions"].append(make_txn("deposit", amt, "Wallet Load", "Other", "Bank"))
-                    save_accounts(); st.success(f"✅ Added ₹{amt}")
+                elif not check_pin(user, pin): st.error("Wrong PIN")
+                elif move_money("deposit", get_ledger().deposit, user, amt):
+                    st.success(f"✅ Added ₹{amt}")
 
+@perf.timed()
 def ui_withdraw():
     st.header("🏧 Withdraw")
     user = st.session_state.current_user
-    acc = st.session_state.accounts[user]
     with st.container(border=True):
         with st.form("withdraw", clear_on_submit=True):
             amt = st.number_input("Amount (₹)", min_value=0.0, step=100.0)
@@ -392,90 +487,210 @@ def ui_withdraw():
             pin = st.text_input("Confirm PIN", type="password", max_chars=4)
             if st.form_submit_button("Withdraw"):
                 if amt <= 0: st.error("Invalid Amount")
-                elif amt > acc["balance"]: st.error("Low Balance")
-                elif hash_pin(pin) != acc["pin"]: st.error("Wrong PIN")
-                else:
-                    acc["balance"] -= amt
-                    acc["transactions"].append(make_txn("withdraw", amt, note, cat, "ATM"))
-                    save_accounts(); st.success(f"✅ Withdrawn ₹{amt}")
+                elif not check_pin(user, pin): st.error("Wrong PIN")
+                elif move_money("withdraw", get_ledger().withdraw, user, amt, note, cat):
+                    st.success(f"✅ Withdrawn ₹{amt}")
 
+@perf.timed()
 def ui_qr_tools():
+    import qrcache
     st.header("🟦 QR Code")
     user = st.session_state.current_user
     t1, t2 = st.tabs(["Generate QR", "Scan QR"])
     
     with t1:
-        with st.form("qr_make"):
-            amt = st.number_input("Amount", min_value=0.0)
-            if st.form_submit_button("Create QR"):
-                data = json.dumps({"to": user, "amount": amt, "ts": str(time.time())})
-                qr = qrcode.QRCode(box_size=10, border=2); qr.add_data(data); qr.make(fit=True)
-                img = qr.make_image(fill_color="#0284c7", back_color="white")
-                buf = BytesIO(); img.save(buf)
-                st.image(buf.getvalue(), width=250)
-                st.code(data, language="json")
+        c1, c2 = st.columns(2)
+        with c1:
+            st.markdown("**My QR (any amount)**")
+            with perf.span("qr.render"): data, png = qrcache.static_qr(user)
+            st.image(png, width=250)
+            st.code(data, language="json")
+        with c2:
+            with st.form("qr_make"):
+                amt = st.number_input("Amount", min_value=0.0)
+                if st.form_submit_button("Create QR"):
+                    with perf.span("qr.render"): data, png = qrcache.payment_qr(user, amt)
+                    st.image(png, width=250)
+                    st.code(data, language="json")
     
     with t2:
-        user_acc = st.session_state.accounts[user]
         with st.form("qr_scan", clear_on_submit=True):
             payload = st.text_area("Paste QR JSON")
+            open_amt = st.number_input("Amount (for any-amount QR)", min_value=0.0)
             cat = st.selectbox("Category", CATEGORIES)
             pin = st.text_input("PIN", type="password", max_chars=4)
             if st.form_submit_button("Pay"):
                 try:
-                    d = json.loads(payload); to_u = d["to"]; amt = d["amount"]
-                    if not to_u in st.session_state.accounts: st.error("Invalid QR")
-                    elif hash_pin(pin) != user_acc["pin"]: st.error("Wrong PIN")
-                    elif user_acc["balance"] < amt: st.error("Low Balance")
-                    else:
-                        user_acc["balance"] -= amt
-                        st.session_state.accounts[to_u]["balance"] += amt
-                        user_acc["transactions"].append(make_txn("qr_out", amt, "QR Pay", cat, to_u))
-                        st.session_state.accounts[to_u]["transactions"].append(make_txn("qr_in", amt, "QR Pay", "Sales", user))
-                        add_notification(to_u, f"QR Payment: Received ₹{amt} from {user}")
-                        save_accounts(); st.success("Paid!")
+                    d = json.loads(payload); to_u = d["to"]; amt = d.get("amount", open_amt)
+                    if not to_u in get_ledger(): st.error("Invalid QR")
+                    elif not check_pin(user, pin): st.error("Wrong PIN")
+                    elif move_money("qr_scan", get_ledger().qr_pay, user, to_u, amt, cat):
+                        st.success("Paid!")
                 except: st.error("Invalid Data")
 
+@perf.timed()
 def ui_history():
+    import pandas as pd
+    import plotly.express as px
     st.header("📜 Analysis")
     user = st.session_state.current_user
-    df = pd.DataFrame(st.session_state.accounts[user]["transactions"])
-    if not df.empty:
-        st.dataframe(df.sort_values("timestamp", ascending=False), use_container_width=True)
+    agg = get_ledger().aggregates(user)
+    if agg.count_by_type:
+        with st.expander("🔎 Filters"):
+            c1, c2 = st.columns(2)
+            with c1: dates = st.date_input("Date range", value=())
+            with c2: types = st.multiselect("Type", TXN_TYPES)
+            c1, c2 = st.columns(2)
+            with c1: cat = st.selectbox("Category", ["All"] + CATEGORIES + ["Transfer", "Uncategorized", "Sales"])
+            with c2: cp = st.text_input("Counterparty").strip().lower()
+        start = datetime.combine(dates[0], datetime.min.time()).timestamp() if dates else None
+        end = datetime.combine(dates[-1], datetime.max.time()).timestamp() if dates else None
+        filters = (start, end, tuple(types), cat, cp)
+        # Cursor stack of the pages visited so far; any filter change starts over.
+        if st.session_state.get("hist_filters") != filters:
+            st.session_state.hist_filters, st.session_state.hist_cursors = filters, [None]
+        cursors = st.session_state.hist_cursors
+        rows, nxt = get_store().query_transactions(user, cursors[-1], HISTORY_PAGE, start, end, types,
+                                                   None if cat == "All" else cat, cp or None)
+        if rows:
+            with perf.span("history.dataframe"):
+                df = pd.DataFrame(rows)[['timestamp', 'type', 'amount', 'note', 'category', 'counterparty', 'id']]
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        else: st.info("No matching transactions.")
+        c1, c2, c3 = st.columns([1, 2, 1])
+        with c1:
+            if len(cursors) > 1 and st.button("⬅️ Newer"): cursors.pop(); st.rerun()
+        with c2: st.caption(f"Page {len(cursors)}")
+        with c3:
+            if nxt is not None and st.button("Older ➡️"): cursors.append(nxt); st.rerun()
         st.markdown("### 📊 Spending Breakdown")
-        out = df[df['type'].isin(['withdraw', 'transfer_out', 'qr_out', 'bill_pay'])]
-        if not out.empty:
-            fig = px.pie(out, values='amount', names='category', hole=0.4)
+        if agg.spend_by_category:
+            with perf.span("history.plotly"): fig = px.pie(values=list(agg.spend_by_category.values()), names=list(agg.spend_by_category), hole=0.4)
             st.plotly_chart(fig, use_container_width=True)
+        st.markdown("### 📅 Trends")
+        period = st.radio("Period", ["M", "W", "D"], horizontal=True,
+                          format_func={"M": "Monthly", "W": "Weekly", "D": "Daily"}.get)
+        with perf.span("history.analytics"): report = get_analytics().report(user, period)
+        st.bar_chart(report.trend[["in", "out"]])
+        c1, c2 = st.columns([2, 1])
+        with c1:
+            st.markdown("**Running Balance**")
+            st.line_chart(report.balance)
+        with c2:
+            st.markdown("**Top Payees**")
+            st.dataframe(report.counterparties, use_container_width=True)
     else: st.info("Empty.")
 
+@perf.timed()
 def ui_admin():
+    import pandas as pd
     st.header("👑 Admin")
-    accs = st.session_state.accounts
-    total = sum(a['balance'] for a in accs.values())
-    st.metric("System Funds", f"₹{total:,.2f}")
-    data = [{"User": u, "Balance": d['balance'], "Txns": len(d['transactions'])} for u, d in accs.items()]
-    st.dataframe(pd.DataFrame(data), use_container_width=True)
+    sysc = get_ledger().system
+    c1, c2, c3 = st.columns(3)
+    c1.metric("System Funds", f"₹{sysc.total_funds:,.2f}")
+    c2.metric("Users", f"{sysc.users:,}")
+    c3.metric("Transactions", f"{sysc.transactions:,}")
+    c1, c2 = st.columns([2, 1])
+    with c1:
+        st.markdown("### 📈 Daily Volume (last 30 days)")
+        days = sorted(sysc.daily_volume)[-30:]
+        if days: st.bar_chart(pd.Series({d: sysc.daily_volume[d] for d in days}, name="Volume"))
+    with c2:
+        st.markdown("### 🧾 By Type")
+        st.dataframe(pd.Series(sysc.count_by_type, name="Count"), use_container_width=True)
+
+    st.markdown("### 👥 Accounts")
+    search = st.text_input("Search user").strip().lower()
+    if st.session_state.get("admin_search") != search:
+        st.session_state.admin_search, st.session_state.admin_cursors = search, [None]
+    cursors = st.session_state.admin_cursors
+    rows, nxt = get_store().account_page(cursors[-1], ADMIN_PAGE, search or None)
+    st.dataframe(pd.DataFrame(rows, columns=reports.REPORT_COLUMNS), use_container_width=True, hide_index=True)
+    c1, c2, c3 = st.columns([1, 2, 1])
+    with c1:
+        if len(cursors) > 1 and st.button("⬅️ Prev"): cursors.pop(); st.rerun()
+    with c2: st.caption(f"Page {len(cursors)}")
+    with c3:
+        if nxt is not None and st.button("Next ➡️"): cursors.append(nxt); st.rerun()
 
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("🏆 Top 10 by Balance"):
+            st.dataframe(pd.DataFrame(reports.top_accounts(get_store(), 10, search=search or None),
+                                      columns=reports.REPORT_COLUMNS), use_container_width=True, hide_index=True)
+    with c2:
+        if st.button("💾 Export Report (CSV)"):
+            n = reports.export(get_store(), "admin_report.csv", search or None)
+            st.success(f"Exported {n:,} accounts to admin_report.csv")
+    st.markdown("### 🚩 Risk Alerts")
+    scorer = get_scorer()
+    alerts = scorer.recent_alerts(20)
+    if alerts:
+        st.dataframe(pd.DataFrame(alerts, columns=["time", "user", "type", "amount", "counterparty", "flags"]),
+                     use_container_width=True, hide_index=True)
+    else: st.info("No anomalies flagged.")
+    counts = dict(scorer.flag_counts)  # copied in one step; the scoring thread keeps adding
+    st.caption(" · ".join([f"{k}: {v:,}" for k, v in sorted(counts.items())] + [f"scoring lag: {scorer.lag():,}"]))
+
+    # Cross-user reports scan the whole ledger, so they run on request only.
+    if st.button("🗂️ Spend by Category (all users)"):
+        with perf.span("admin.analytics"): report = get_analytics().report(None, "M")
+        if len(report.categories): st.bar_chart(report.categories)
+        else: st.info("No spending yet.")
+    if st.button("Rebuild Aggregates"):
+        drifted = get_ledger().rebuild_aggregates()
+        if drifted: st.warning(f"Rebuilt; aggregates differed for: {', '.join(drifted)}")
+        else: st.success("Rebuilt every account; all cached aggregates matched the raw history.")
+
+@perf.timed()
 def ui_settings():
     st.header("⚙️ Settings")
     user = st.session_state.current_user
-    acc = st.session_state.accounts[user]
     
     with st.form("pin_chg", clear_on_submit=True):
         st.subheader("Change PIN")
         old = st.text_input("Old PIN", type="password", max_chars=4)
         new = st.text_input("New PIN", type="password", max_chars=4)
         if st.form_submit_button("Update"):
-            if hash_pin(old) == acc["pin"] and len(new)==4 and new.isdigit():
-                acc["pin"] = hash_pin(new); save_accounts(); st.success("Updated!")
+            if len(new)==4 and new.isdigit() and check_pin(user, old):
+                save_accounts(set_record(user, pin=hash_pin(new))); STEP_UP.revoke(session_token()); st.success("Updated!")
             else: st.error("Invalid Details")
 
+@perf.timed()
+def ui_performance():
+    import pandas as pd
+    st.markdown("---")
+    st.header("⏱️ Performance")
+    if not perf.ENABLED: st.info("Instrumentation is off; start the app with WALLET_PERF=1 to collect timings.")
+    snap = perf.snapshot()
+    if snap["histograms"]:
+        df = pd.DataFrame.from_dict(snap["histograms"], orient="index")
+        for col in ("mean_s", "p50_s", "p95_s", "p99_s", "max_s"): df[col.replace("_s", "_ms")] = df.pop(col) * 1e3
+        st.dataframe(df.drop(columns="sum_s").sort_values("p95_ms", ascending=False), use_container_width=True)
+    if snap["counters"]: st.dataframe(pd.Series(snap["counters"], name="Count"), use_container_width=True)
+    if "qrcache" in sys.modules:
+        info = sys.modules["qrcache"].render_qr_png.cache_info()
+        st.caption(f"QR cache: {info.hits:,} hits / {info.misses:,} misses ({info.currsize}/{info.maxsize})")
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.download_button("Prometheus", perf.to_prometheus(), "wallet_metrics.prom")
+    with c2: st.download_button("JSON", perf.to_json(), "wallet_metrics.json")
+    with c3:
+        if st.button("Write Dump"): st.success(f"Wrote {perf.dump()}")
+    with c4:
+        if st.button("Reset"): perf.reset(); st.rerun()
+    if st.button("🔬 Profile Next Rerun"): st.session_state.profile_next = True
+    if perf.last_profile:
+        with st.expander("Last profiled rerun (rerun.prof)"): st.code(perf.last_profile)
+    if st.button("Close Performance"): st.session_state.perf_page = False; st.rerun()
+
 # ---------------------------------------------------------
 # 6. MAIN ROUTER
 # ---------------------------------------------------------
+@perf.timed("rerun")
 def main():
     check_timeout()
+    start_worker()
     if not st.session_state.current_user:
         auth = st.sidebar.radio("Auth", ["Login", "Sign Up"])
         if auth=="Login": ui_login()
@@ -487,29 +702,34 @@ def main():
             
             # Notification Badge
             user = st.session_state.current_user
-            notif_count = len(st.session_state.accounts[user].get("notifications", []))
+            notif_count = get_ledger().account(user).get("unread", 0)
             notif_label = f"Notifications ({notif_count})" if notif_count > 0 else "Notifications"
             
             menu = st.radio("Menu", [
-                "Dashboard", "Add Money", "Withdraw", "Transfer", "Bill Payment",
+                "Dashboard", "Add Money", "Withdraw", "Transfer", "Bill Payment", "Scheduled Payments",
                 "My QR & Scan", notif_label, "History & Reports", "Settings"
             ])
             if st.session_state.current_user == "admin": 
                 if st.button("Admin Panel"): menu = "Admin Panel"
+                if st.button("Performance"): st.session_state.perf_page = True
             
             st.markdown("---")
-            if st.button("Logout"): st.session_state.current_user = None; st.rerun()
+            if st.button("Logout"):
+                STEP_UP.revoke(session_token()); st.session_state.current_user = None; st.rerun()
 
         if menu == "Dashboard": ui_dashboard()
         elif menu == "Add Money": ui_deposit()
         elif menu == "Withdraw": ui_withdraw()
         elif menu == "Transfer": ui_transfer()
         elif menu == "Bill Payment": ui_bill_pay()
+        elif menu == "Scheduled Payments": ui_scheduled()
         elif menu == "My QR & Scan": ui_qr_tools()
         elif menu == notif_label: ui_notifications()
         elif menu == "History & Reports": ui_history()
         elif menu == "Settings": ui_settings()
         elif menu == "Admin Panel": ui_admin()
+        if st.session_state.get("perf_page") and user == "admin": ui_performance()
 
 if __name__ == "__main__":
-    main()
+    if st.session_state.pop("profile_next", False): perf.profile(main, path="rerun.prof")
+    else: main()
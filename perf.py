@@ -0,0 +1,136 @@
+"""
+Hot-path timing and counters
+-------------------------------------------------------
+Off unless WALLET_PERF=1. When off, `timed` returns the function unchanged and
+`span`/`count` do nothing, so instrumented code pays one attribute check at
+most. When on, every sample lands in an in-memory log2 histogram (1 µs .. ~1 h)
+shared by all sessions of the server process.
+
+Set WALLET_PERF_DUMP=perf.prom (or .json) to write the metrics at exit; the
+admin Performance page can also write or download them on demand.
+"""
+
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+ENABLED = os.environ.get("WALLET_PERF", "").lower() in ("1", "true", "yes", "on")
+DUMP_PATH = os.environ.get("WALLET_PERF_DUMP")
+BUCKETS = 32  # bucket i holds samples below 2**i µs
+
+class Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count, self.total, self.max, self.buckets = 0, 0.0, 0.0, [0] * BUCKETS
+
+    def observe(self, seconds):
+        self.count += 1; self.total += seconds
+        if seconds > self.max: self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th sample; within 2x of the true value.
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank: return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "sum_s": self.total, "mean_s": self.total / self.count if self.count else 0.0,
+                "p50_s": self.quantile(.5), "p95_s": self.quantile(.95), "p99_s": self.quantile(.99),
+                "max_s": self.max}
+
+_lock = threading.Lock()
+_hists = {}
+_counters = {}
+last_profile = None  # text report of the most recent profiled rerun
+
+def observe(name, seconds):
+    with _lock:
+        h = _hists.get(name)
+        if h is None: h = _hists[name] = Histogram()
+        h.observe(seconds)
+
+def count(name, n=1):
+    if not ENABLED: return
+    with _lock: _counters[name] = _counters.get(name, 0) + n
+
+@contextmanager
+def _span(name):
+    t = time.perf_counter()
+    try: yield
+    finally: observe(name, time.perf_counter() - t)
+
+_OFF = nullcontext()
+
+def span(name):
+    return _span(name) if ENABLED else _OFF
+
+def timed(name=None):
+    """Decorator recording each call's duration under `name` (default: the function name)."""
+    def deco(fn):
+        if not ENABLED: return fn
+        key = name or fn.__name__
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: observe(key, time.perf_counter() - t)
+        return wrapper
+    return deco
+
+def snapshot():
+    with _lock:
+        return {"histograms": {k: h.to_dict() for k, h in sorted(_hists.items())}, "counters": dict(sorted(_counters.items()))}
+
+def reset():
+    with _lock: _hists.clear(); _counters.clear()
+
+def _metric(name):
+    return "wallet_" + "".join(c if c.isalnum() else "_" for c in name)
+
+def to_prometheus():
+    out = []
+    with _lock:
+        for name, h in sorted(_hists.items()):
+            m = _metric(name) + "_seconds"
+            out.append(f"# TYPE {m} histogram")
+            seen = 0
+            for i, n in enumerate(h.buckets[:-1]):
+                seen += n
+                if n: out.append(f'{m}_bucket{{le="{2 ** i / 1e6:g}"}} {seen}')
+            out += [f'{m}_bucket{{le="+Inf"}} {h.count}', f"{m}_sum {h.total:.6f}", f"{m}_count {h.count}"]
+        for name, v in sorted(_counters.items()):
+            out += [f"# TYPE {_metric(name)}_total counter", f"{_metric(name)}_total {v}"]
+    return "\n".join(out) + "\n"
+
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+def dump(path=None):
+    """Write metrics as Prometheus text, or JSON when the path ends in .json."""
+    path = path or DUMP_PATH or "perf_metrics.prom"
+    with open(path, "w") as f: f.write(to_json() if path.endswith(".json") else to_prometheus())
+    return path
+
+def profile(fn, *args, path=None, top=40, **kwargs):
+    """Run fn once under cProfile; keep the cumulative-time report in `last_profile`."""
+    global last_profile
+    prof = cProfile.Profile()
+    try: return prof.runcall(fn, *args, **kwargs)
+    finally:
+        if path: prof.dump_stats(path)
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+        last_profile = buf.getvalue()
+
+if ENABLED and DUMP_PATH: atexit.register(dump)
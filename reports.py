@@ -0,0 +1,78 @@
+"""
+Streaming admin reports
+-------------------------------------------------------
+Walks accounts page by page through `Storage.account_page`, so memory stays
+bounded by the page size however many users there are.
+
+    python reports.py export admin_report.csv [--search ali] [--chunk 5000]
+    python reports.py export admin_report.parquet      # needs pyarrow
+    python reports.py top 10 --by txns
+"""
+
+import argparse
+import csv
+import heapq
+
+from storage import open_store
+
+REPORT_COLUMNS = ("User", "Balance", "Txns")
+
+def iter_rows(store, search=None, chunk=1000):
+    cursor = None
+    while True:
+        rows, cursor = store.account_page(cursor, chunk, search)
+        yield from rows
+        if cursor is None: return
+
+def iter_chunks(store, search=None, chunk=1000):
+    cursor = None
+    while True:
+        rows, cursor = store.account_page(cursor, chunk, search)
+        if rows: yield rows
+        if cursor is None: return
+
+def top_accounts(store, n=10, by="balance", search=None):
+    col = REPORT_COLUMNS.index("Txns") if by == "txns" else REPORT_COLUMNS.index("Balance")
+    return heapq.nlargest(n, iter_rows(store, search), key=lambda r: r[col])
+
+def export(store, path, search=None, chunk=5000):
+    """Write the per-user report to .csv or .parquet one chunk at a time."""
+    n = 0
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        schema = pa.schema([("User", pa.string()), ("Balance", pa.float64()), ("Txns", pa.int64())])
+        with pq.ParquetWriter(path, schema) as writer:
+            for rows in iter_chunks(store, search, chunk):
+                writer.write_table(pa.Table.from_arrays([list(c) for c in zip(*rows)], schema=schema))
+                n += len(rows)
+        return n
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(REPORT_COLUMNS)
+        for rows in iter_chunks(store, search, chunk):
+            w.writerows(rows); n += len(rows)
+    return n
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="SkyWallet admin reports")
+    ap.add_argument("--backend", choices=("json", "sqlite"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="write the per-user report to .csv or .parquet")
+    e.add_argument("path")
+    e.add_argument("--search")
+    e.add_argument("--chunk", type=int, default=5000)
+    t = sub.add_parser("top", help="print the top-N accounts")
+    t.add_argument("n", type=int, nargs="?", default=10)
+    t.add_argument("--by", choices=("balance", "txns"), default="balance")
+    args = ap.parse_args()
+    store = open_store(args.backend)
+    if args.cmd == "export":
+        print(f"Exported {export(store, args.path, args.search, args.chunk)} accounts to {args.path}")
+    else:
+        for user, bal, txns in top_accounts(store, args.n, args.by):
+            print(f"{user:20s} ₹{bal:>14,.2f} {txns:>8d} txns")
+    store.close()
@@ -0,0 +1,311 @@
+"""
+Standing instructions: scheduled and recurring payments
+-------------------------------------------------------
+An instruction (a bill payment or a transfer, once / daily / weekly / monthly)
+is stored in its owner's account header under "standing", so it is journaled
+like any other change. The scheduler keeps one heap entry per active
+instruction, ordered by due time: each tick pops only what is due and never
+scans accounts (the heap is built once at startup).
+
+A due item runs through the same Ledger paths as the forms (amount, balance,
+lock and payee checks in Ledger._move). Its payment and the instruction's
+updated state are committed in one store append, written before the accounts'
+locks are released (Ledger.atomic). On a shared (sharded) store, instructions
+saved by other processes are picked up by a rescan every RESCAN_SECONDS,
+which reads only the accounts whose instructions were written since the
+previous one (Storage.standing_changes), never the whole store.
+
+An item that fails on a retryable error ("Insufficient Balance", "Account
+Locked") is retried with exponential backoff. After MAX_RETRIES the
+occurrence is skipped; the owner is notified of the first failure and the
+skip. Finished ("once" after it ran) and cancelled instructions are dropped
+from the header, so it only ever holds what is still to run.
+
+Inside the app the worker runs on a daemon thread of the server process,
+started on the first page view after a (re)start, not the first login, and
+independent of reruns. The same worker runs standalone (it must then be the
+store's only writer, e.g. a batch host), or against a simulated clock. A
+simulation makes payments, stamped with simulated time, in a scratch copy of
+the store (discarded afterwards) or in the file given with --db:
+    python scheduler.py run [--poll 30]
+    python scheduler.py simulate --days 90 [--db sim.json]
+"""
+
+import argparse
+import heapq
+import itertools
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from ledger import LedgerError, add_notification, amount_error, consumer_no_error
+from storage import set_record
+from txnid import IdGenerator
+
+KINDS = ("bill", "transfer")
+REPEATS = ("once", "daily", "weekly", "monthly")
+RETRYABLE = ("Insufficient Balance", "Account Locked")
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 15 * 60  # doubles on every retry: 15 min .. 4 h
+BATCH_SIZE = 200
+POLL_SECONDS = 30.0
+RESCAN_SECONDS = 60.0  # shared stores: how often instructions other processes saved are queued
+_ids = IdGenerator(prefix="SI-")
+
+class SystemClock:
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds, wake):
+        wake.wait(seconds)
+
+class SimulatedClock:
+    """Time only moves when the scheduler sleeps or `advance` is called."""
+
+    def __init__(self, start=None):
+        self.t = time.time() if start is None else start
+
+    def now(self):
+        return self.t
+
+    def advance(self, seconds):
+        self.t += seconds
+
+    def sleep(self, seconds, wake):
+        self.t += seconds
+
+def occurrence(anchor, repeat, n):
+    """Due time of the n-th occurrence; computed from the anchor so months never drift."""
+    if n == 0 or repeat == "once": return anchor
+    first = datetime.fromtimestamp(anchor)
+    if repeat == "daily": return int((first + timedelta(days=n)).timestamp())
+    if repeat == "weekly": return int((first + timedelta(weeks=n)).timestamp())
+    y, m = divmod(first.month - 1 + n, 12)
+    month_end = (datetime(first.year + y + (m == 11), (m + 1) % 12 + 1, 1) - timedelta(days=1)).day
+    return int(first.replace(year=first.year + y, month=m + 1, day=min(first.day, month_end)).timestamp())
+
+def instruction_error(ledger, user, kind, to, amount, repeat, consumer_no=None):
+    """Same checks as the bill / transfer forms; None when the instruction is valid."""
+    if kind not in KINDS: return "Unknown payment type"
+    if repeat not in REPEATS: return "Unknown schedule"
+    if amount_error(amount): return amount_error(amount)
+    if kind == "bill": return consumer_no_error(consumer_no) if to else "Select a biller"
+    if to not in ledger: return "User not found"
+    if to == user: return "Self transfer not allowed"
+    return None
+
+class Scheduler:
+    def __init__(self, ledger, clock=None, batch_size=BATCH_SIZE):
+        self.ledger = ledger
+        self.clock = clock or ledger.clock or SystemClock()
+        self.batch_size = batch_size
+        self._heap = []  # (due, tie, user, instruction id); stale entries are skipped on pop
+        self._queued = set()  # (user, instruction id, due) currently in the heap
+        self._scanned = self.clock.now()
+        self._cursor = None  # position in the store's instruction change log, for rescan
+        self._guard = threading.Lock()
+        self._tie = itertools.count()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        for user, acc in list(ledger.accounts.items()):
+            for ins in acc.get("standing", {}).values():
+                if ins["active"]: self._push(user, ins)
+
+    # --- instructions ---
+    def instructions(self, user):
+        return sorted((self.ledger.account(user) or {}).get("standing", {}).values(), key=lambda i: i["next"])
+
+    def add(self, user, kind, to, amount, first_due, repeat="once", note="", consumer_no=None):
+        err = instruction_error(self.ledger, user, kind, to, amount, repeat, consumer_no)
+        if err: raise LedgerError(err)
+        first_due = int(first_due)
+        ins = {"id": _ids.next(), "kind": kind, "to": to, "amount": float(round(amount, 2)), "note": note,
+               "consumer_no": consumer_no, "repeat": repeat, "anchor": first_due, "n": 0, "next": first_due,
+               "retries": 0, "last_error": "", "active": True}
+        with self.ledger.locked(user):
+            self._save(user, ins)
+        self._push(user, ins)
+        self._wake.set()
+        return ins
+
+    def cancel(self, user, sid):
+        with self.ledger.locked(user):
+            ins = (self.ledger.account(user) or {}).get("standing", {}).get(sid)
+            if ins is None or not ins["active"]: return False
+            self._save(user, dict(ins, active=False))  # dropped; its heap entry goes stale and is skipped
+        return True
+
+    def rescan(self):
+        """Queue instructions written since the last rescan, by any process; returns how many were added."""
+        users, self._cursor = self.ledger.store.standing_changes(self._cursor)
+        added = 0
+        for user in users:
+            for ins in (self.ledger.store.get_account(user) or {}).get("standing", {}).values():
+                if ins["active"]: added += self._push(user, ins)
+        return added
+
+    def next_due(self):
+        with self._guard: return self._heap[0][0] if self._heap else None
+
+    # --- execution ---
+    def run_due(self, now=None, limit=None):
+        """Execute everything due at `now`, popped in batches; returns [(user, id, status)]."""
+        now = self.clock.now() if now is None else now
+        done = []
+        while True:
+            batch = self._pop_due(now, limit=self.batch_size if limit is None else min(self.batch_size, limit - len(done)))
+            if not batch: return done
+            for user, sid, due in batch:
+                status = self._run_one(user, sid, due, now)
+                if status: done.append((user, sid, status))
+            if limit is not None and len(done) >= limit: return done
+
+    def _pop_due(self, now, limit):
+        out = []
+        with self._guard:
+            while self._heap and self._heap[0][0] <= now and len(out) < limit:
+                due, _, user, sid = heapq.heappop(self._heap)
+                self._queued.discard((user, sid, due))
+                out.append((user, sid, due))
+        return out
+
+    def _run_one(self, user, sid, due, now):
+        ins = (self.ledger.account(user) or {}).get("standing", {}).get(sid)
+        if not ins or not ins["active"] or ins["next"] != due: return None
+        payee = (ins["to"],) if ins["kind"] == "transfer" else ()
+        with self.ledger.atomic(user, *payee):  # payment + state in one append, stored before unlocking
+            ins = self.ledger.account(user).get("standing", {}).get(sid)
+            if not ins or not ins["active"] or ins["next"] != due: return None
+            status, ins, notes = self._attempt(user, ins, now)
+            self._save(user, ins, *notes)
+        if ins["active"]: self._push(user, ins)
+        return status
+
+    def _attempt(self, user, ins, now):
+        label = ins["to"] if ins["kind"] == "bill" else f"transfer to {ins['to']}"
+        key = f"standing:{ins['id']}:{ins['n']}"  # one payment per occurrence, even if re-run
+        try:
+            if ins["kind"] == "bill": self.ledger.pay_bill(user, ins["amount"], ins["to"], idem_key=key)
+            else:
+                self.ledger.transfer(user, ins["to"], ins["amount"], ins["note"] or "Scheduled", idem_key=key)
+        except LedgerError as e:
+            err = str(e)
+            if err in RETRYABLE and ins["retries"] < MAX_RETRIES:
+                retry_at = int(now + BACKOFF_SECONDS * 2 ** ins["retries"])
+                msg = f"⏳ Scheduled {label} of ₹{ins['amount']} failed ({err}); retrying until it goes through"
+                notes = [msg] if ins["retries"] == 0 else []  # one notice per occurrence, not per retry
+                return "retry", dict(ins, retries=ins["retries"] + 1, next=retry_at, last_error=err), notes
+            ins = self._advance(dict(ins, last_error=err))
+            return "skipped", ins, [f"⚠️ Scheduled {label} of ₹{ins['amount']} was skipped: {err}"]
+        ins = self._advance(dict(ins, last_error=""))
+        if ins["kind"] == "bill": return "paid", ins, []  # pay_bill already notifies the payer
+        return "paid", ins, [f"🗓️ Scheduled {label} of ₹{ins['amount']} sent"]
+
+    def _advance(self, ins):
+        if ins["repeat"] == "once": return dict(ins, active=False, retries=0)
+        n = ins["n"] + 1
+        return dict(ins, n=n, next=occurrence(ins["anchor"], ins["repeat"], n), retries=0)
+
+    def _save(self, user, ins, *notes):
+        standing = {k: v for k, v in self.ledger.account(user).get("standing", {}).items() if v["active"]}
+        if ins["active"]: standing[ins["id"]] = ins
+        else: standing.pop(ins["id"], None)
+        now = self.clock.now()
+        self.ledger.commit(set_record(user, standing=standing), *(add_notification(user, m, now=now) for m in notes))
+
+    def _push(self, user, ins):
+        key = (user, ins["id"], ins["next"])
+        with self._guard:
+            if key in self._queued: return False
+            self._queued.add(key)
+            heapq.heappush(self._heap, (ins["next"], next(self._tie), user, ins["id"]))
+        return True
+
+    # --- worker ---
+    def run(self, until=None, poll=POLL_SECONDS):
+        """Execute due items until stop() is called or the clock passes `until`."""
+        while not self._stop.is_set():
+            self._wake.clear()
+            if self.ledger.store.shared and self.clock.now() - self._scanned >= RESCAN_SECONDS:
+                self._scanned = self.clock.now()
+                self.rescan()
+            self.run_due()
+            now = self.clock.now()
+            if until is not None and now >= until: return
+            nxt = self.next_due()
+            delay = poll if nxt is None else min(poll, max(0.0, nxt - now))
+            if self.ledger.store.shared: delay = min(delay, max(0.0, self._scanned + RESCAN_SECONDS - now))
+            if until is not None: delay = min(delay, until - now)
+            self.clock.sleep(delay, self._wake)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="wallet-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set(); self._wake.set()
+        if self._thread is not None: self._thread.join()
+
+def open_path(path):
+    from storage import JournalStore, SQLiteStore
+    return SQLiteStore(path) if path.endswith(".db") else JournalStore(path)
+
+def scratch_copy(src, path, batch=500):
+    """Copy every account of `src` into a new store at `path`."""
+    from storage import create_record
+    dst, chunk = open_path(path), []
+    for user, acc in src.iter_accounts():
+        chunk.append(create_record(user, acc))
+        if len(chunk) >= batch: dst.append(*chunk); chunk = []
+    dst.append(*chunk)
+    return dst
+
+def simulate(ledger, days):
+    clock = ledger.clock
+    sched = Scheduler(ledger)
+    end = clock.now() + days * 86400
+    counts = {}
+    while clock.now() < end:
+        for user, sid, status in sched.run_due():
+            counts[status] = counts.get(status, 0) + 1
+            print(f"{datetime.fromtimestamp(clock.now()):%Y-%m-%d %H:%M}  {user:12s} {sid}  {status}")
+        nxt = sched.next_due()
+        if nxt is None: break
+        clock.advance(max(0.0, min(nxt, end) - clock.now()) or 1)
+    return counts
+
+def main():
+    from ledger import Ledger
+    from storage import open_store
+    ap = argparse.ArgumentParser(description="Run the standing-instruction worker.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run", help="execute due payments until interrupted")
+    run.add_argument("--poll", type=float, default=POLL_SECONDS)
+    sim = sub.add_parser("simulate", help="fast-forward a simulated clock over the stored instructions")
+    sim.add_argument("--days", type=float, default=30)
+    sim.add_argument("--db", help="wallet file to simulate in (.json or .db); default: a scratch copy of the live store")
+    args = ap.parse_args()
+
+    if args.cmd == "run":
+        ledger = Ledger(open_store())
+        try: Scheduler(ledger).run(poll=args.poll)
+        except KeyboardInterrupt: pass
+        finally: ledger.close()
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db: store = open_path(args.db)
+        else:
+            live = open_store()
+            store = scratch_copy(live, os.path.join(tmp, "scratch.json"))
+            live.close()
+        ledger = Ledger(store, SimulatedClock())
+        try: print(simulate(ledger, args.days))
+        finally: ledger.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Risk scoring: behaviour-based credit score and anomaly flags
+-------------------------------------------------------
+Each user has one fixed-size RiskFeatures record, updated a transaction at a
+time, so memory follows the number of users and never the history length:
+
+- velocity: decayed counts of transfers / QR payments sent (1 h half-life)
+- amount profile: exponentially weighted mean and variance of log outflow
+  amounts, giving a z-score for every new payment
+- payee novelty: a 2048-bit Bloom filter of counterparties paid before
+- flow: decayed inflow and outflow (30-day half-life), account age and
+  activity, and a decayed count of the flags raised so far
+
+Flags are "burst" and "qr_burst" (velocity), "large_amount" (z-score) and
+"new_payee" (an unusually large first payment to someone). The credit score
+(300-850) weighs balance, net flow, history and recent flags.
+
+Streaming: a Scorer subscribes to the Ledger, so the payment path only puts
+(user, txn) on a queue; a daemon thread folds queued rows in batches. On
+start the thread first replays the stored history. Rows written while it does
+are both in the store and on the queue, so the ids of replayed rows newer than
+the subscription are kept until the queue first runs dry, and skipped there.
+
+Batch: `rescan(store, workers)` replays the history on a forked process pool,
+one shard of users per task, each worker reading through `store.after_fork()`.
+
+    python scoring.py [--workers 8] [--top 20]
+"""
+
+import argparse
+import heapq
+import math
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from functools import lru_cache
+from queue import Empty, SimpleQueue
+
+from aggregates import OUTFLOW_TYPES
+from txncolumns import minute_stamp, txn_ts
+
+SENT_TYPES = ("transfer_out", "qr_out")  # money sent to another user
+VELOCITY_HALF_LIFE = 3600
+FLOW_HALF_LIFE = 30 * 86400
+AMOUNT_ALPHA = 0.1  # weight of the newest payment in the amount profile
+MIN_SD = 0.25       # log scale: amounts within ~x1.3 of the usual are never outliers
+MIN_HISTORY = 10    # outflows seen before amounts and payees are judged
+BURST_LIMIT = 8.0
+QR_BURST_LIMIT = 6.0
+Z_LIMIT = 3.0
+NEW_PAYEE_Z = 1.5
+BLOOM_BITS, BLOOM_HASHES = 2048, 3
+ALERTS = 500
+REPLAY_SLACK = 60  # seconds between a row's timestamp and its commit, at most
+
+@lru_cache(maxsize=1 << 16)
+def _bloom(name):
+    data = str(name).encode()
+    h1, h2 = zlib.crc32(data), zlib.crc32(data, 0x9E3779B9) | 1  # stable across processes, unlike hash()
+    mask = 0
+    for i in range(BLOOM_HASHES): mask |= 1 << (h1 + i * h2) % BLOOM_BITS
+    return mask
+
+class RiskFeatures:
+    __slots__ = ("first_ts", "last_ts", "n", "n_out", "velocity", "qr_velocity",
+                 "inflow", "outflow", "mean", "var", "payees", "n_payees", "risk")
+
+    def __init__(self):
+        self.first_ts = self.last_ts = None
+        self.n = self.n_out = self.n_payees = self.payees = 0
+        self.velocity = self.qr_velocity = self.inflow = self.outflow = 0.0
+        self.mean = self.var = self.risk = 0.0
+
+    def add(self, ts, kind, amount, counterparty):
+        """Fold one transaction in; returns the flags it raised."""
+        if self.first_ts is None: self.first_ts = self.last_ts = ts
+        dt = max(0.0, ts - self.last_ts)
+        self.last_ts = max(self.last_ts, ts)
+        fast, slow = 0.5 ** (dt / VELOCITY_HALF_LIFE), 0.5 ** (dt / FLOW_HALF_LIFE)
+        self.velocity *= fast; self.qr_velocity *= fast
+        self.inflow *= slow; self.outflow *= slow; self.risk *= slow
+        self.n += 1
+        if kind not in OUTFLOW_TYPES:
+            self.inflow += amount
+            return ()
+        self.outflow += amount
+        x = math.log1p(max(amount, 0.0))
+        z = (x - self.mean) / max(math.sqrt(self.var), MIN_SD) if self.n_out >= MIN_HISTORY else 0.0
+        flags = ["large_amount"] if z > Z_LIMIT else []
+        if kind in SENT_TYPES:
+            self.velocity += 1
+            if kind == "qr_out": self.qr_velocity += 1
+            if self.velocity > BURST_LIMIT: flags.append("burst")
+            if self.qr_velocity > QR_BURST_LIMIT: flags.append("qr_burst")
+            bits = _bloom(counterparty)
+            if self.payees & bits != bits:
+                self.payees |= bits
+                self.n_payees += 1
+                if z > NEW_PAYEE_Z: flags.append("new_payee")
+        if self.n_out:
+            d = x - self.mean
+            self.mean += AMOUNT_ALPHA * d
+            self.var = (1 - AMOUNT_ALPHA) * (self.var + AMOUNT_ALPHA * d * d)
+        else: self.mean = x
+        self.n_out += 1
+        self.risk += len(flags)
+        return flags
+
+def credit_score(features, balance):
+    """300-850: balance, net flow, length of history and recent flags."""
+    score = 600 + min(100.0, 25 * math.log10(1 + max(balance, 0.0) / 100))
+    if features is not None and features.n:
+        flow = features.inflow + features.outflow
+        if flow: score += 200 * (features.inflow / flow - 0.5)
+        score += 50 * min(1.0, (features.last_ts - features.first_ts) / (365 * 86400))
+        score += 50 * min(1.0, features.n / 100)
+        score -= min(250.0, 40 * features.risk)
+    return int(min(850, max(300, score)))
+
+def _fold(features, user, txn):
+    """Apply one stored transaction; returns an alert dict or None."""
+    ts = int(txn_ts(txn))
+    flags = features.add(ts, txn["type"], txn["amount"], txn["counterparty"])
+    if not flags: return None
+    return {"time": minute_stamp(ts // 60), "ts": ts, "user": user, "id": txn.get("id"), "type": txn["type"],
+            "amount": txn["amount"], "counterparty": txn["counterparty"], "flags": ", ".join(flags)}
+
+def _count(counts, alert):
+    for flag in alert["flags"].split(", "): counts[flag] = counts.get(flag, 0) + 1
+
+def _latest(alerts, n=ALERTS):
+    return heapq.nlargest(n, alerts, key=lambda a: a["ts"])[::-1]
+
+# ---------------------------------------------------------
+# BATCH RESCAN
+# ---------------------------------------------------------
+def _scan(store, users):
+    features, alerts, counts = {}, [], {}
+    for user in users:
+        f = features[user] = RiskFeatures()
+        for txn in store.transactions(user):
+            alert = _fold(f, user, txn)
+            if alert:
+                alerts.append(alert); _count(counts, alert)
+                if len(alerts) > 2 * ALERTS: alerts = _latest(alerts)
+    return features, _latest(alerts), counts
+
+_fork_store = None
+
+def _init_worker():
+    global _fork_store
+    _fork_store = _fork_store.after_fork()
+
+def _scan_shard(users):
+    return _scan(_fork_store, users)
+
+def rescan(store, workers=1, users=None, shard_size=None):
+    """Replay stored history into fresh features; returns (features, latest alerts, flag counts)."""
+    global _fork_store
+    users = sorted(store.load()) if users is None else list(users)
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return _scan(store, users)
+    size = shard_size or max(1, len(users) // (workers * 8))  # small shards even out heavy accounts
+    shards = [users[i:i + size] for i in range(0, len(users), size)]
+    features, alerts, counts = {}, [], {}
+    _fork_store = store  # inherited by the forked workers, JSON replica included
+    try:
+        with multiprocessing.get_context("fork").Pool(workers, initializer=_init_worker) as pool:
+            for f, a, c in pool.imap_unordered(_scan_shard, shards):
+                features.update(f)
+                alerts = _latest(alerts + a)
+                for k, v in c.items(): counts[k] = counts.get(k, 0) + v
+    finally: _fork_store = None
+    return features, alerts, counts
+
+# ---------------------------------------------------------
+# STREAMING
+# ---------------------------------------------------------
+class Scorer:
+    """Live features for one Ledger; one instance per server process."""
+
+    def __init__(self, ledger, alerts=ALERTS):
+        self.ledger = ledger
+        self.features = {}
+        self.alerts = deque(maxlen=alerts)  # newest last
+        self.flag_counts = {}
+        self.processed = 0
+        self._queue = SimpleQueue()
+        self._guard = threading.Lock()
+        self._thread = None
+        self._since = time.time() - REPLAY_SLACK
+        self._replayed = set()  # ids the backfill folded that may also be queued
+        ledger.subscribe(self.submit)
+
+    def submit(self, user, txn):
+        self._queue.put((user, txn))
+
+    def start(self, backfill=True):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(backfill,), name="wallet-scoring", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(None)
+        if self._thread is not None: self._thread.join()
+
+    def lag(self):
+        """Transactions written but not scored yet."""
+        return self._queue.qsize()
+
+    def _run(self, backfill):
+        if backfill: self._backfill()
+        while True:
+            items = [self._queue.get()]
+            try:
+                while len(items) < 10_000: items.append(self._queue.get(block=False))
+            except Empty: pass
+            with self._guard:
+                for item in items:
+                    if item is None: return
+                    self._add(*item)
+                if self._replayed and self._queue.empty(): self._replayed.clear()  # the overlap is behind us
+
+    def _backfill(self):
+        store, alerts = self.ledger.store, []
+        for user in sorted(store.load()):
+            f, counts = RiskFeatures(), {}
+            for txn in store.transactions(user):
+                if txn_ts(txn) >= self._since: self._replayed.add(txn.get("id"))
+                alert = _fold(f, user, txn)
+                if alert:
+                    alerts.append(alert); _count(counts, alert)
+                    if len(alerts) > 2 * ALERTS: alerts = _latest(alerts)
+            with self._guard:  # scores go live user by user
+                self.features[user] = f
+                for k, v in counts.items(): self.flag_counts[k] = self.flag_counts.get(k, 0) + v
+        with self._guard: self.alerts.extend(_latest(alerts, self.alerts.maxlen))
+
+    def _add(self, user, txn):
+        tid = txn.get("id")
+        if tid in self._replayed: self._replayed.discard(tid); return
+        f = self.features.get(user)
+        if f is None: f = self.features[user] = RiskFeatures()
+        alert = _fold(f, user, txn)
+        self.processed += 1
+        if alert: self.alerts.append(alert); _count(self.flag_counts, alert)
+
+    def credit_score(self, user, balance):
+        return credit_score(self.features.get(user), balance)
+
+    def recent_alerts(self, n=50):
+        with self._guard: return list(self.alerts)[-n:][::-1]
+
+    def top_risk(self, n=10):
+        with self._guard: return heapq.nlargest(n, ((f.risk, u) for u, f in self.features.items() if f.risk >= 0.5))
+
+def main():
+    from storage import open_store
+    ap = argparse.ArgumentParser(description="Rescan the stored history and report risk flags.")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args()
+    store = open_store()
+    headers = store.load()
+    t = time.perf_counter()
+    features, alerts, counts = rescan(store, args.workers, sorted(headers))
+    elapsed = time.perf_counter() - t
+    rows = sum(f.n for f in features.values())
+    print(f"{len(features):,} users, {rows:,} transactions in {elapsed:.2f} s "
+          f"({rows / max(elapsed, 1e-9) / 1e3:,.0f}k rows/s, {args.workers} workers)")
+    print("flags:", ", ".join(f"{k} {v:,}" for k, v in sorted(counts.items())) or "none")
+    print(f"\n{'user':20s} {'risk':>6s} {'score':>6s} {'payees':>7s}")
+    for user, f in heapq.nlargest(args.top, features.items(), key=lambda kv: kv[1].risk):
+        print(f"{user:20s} {f.risk:6.2f} {credit_score(f, headers[user]['balance']):6d} {f.n_payees:7d}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
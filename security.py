@@ -0,0 +1,89 @@
+"""
+PIN hashing and step-up verification
+-------------------------------------------------------
+PINs are stored as salted KDF hashes:
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+chosen with WALLET_PIN_HASHER=pbkdf2|scrypt and WALLET_PIN_COST (PBKDF2
+iterations or scrypt N). Legacy unsalted SHA-256 hex digests still verify and
+report `needs_rehash`, so they are upgraded on the next successful login.
+
+A 4-digit PIN is only 10k guesses, so the KDF cost is what protects a leaked
+database; to avoid paying it on every form, `StepUpCache` remembers a
+successful verification per browser session for a short TTL, keyed to the
+stored hash (a PIN change invalidates it) and checked with a keyed digest.
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PIN_HASHER = os.environ.get("WALLET_PIN_HASHER", "pbkdf2")
+PBKDF2_ITERATIONS = int(os.environ.get("WALLET_PIN_COST", 0)) or 200_000
+SCRYPT_N = int(os.environ.get("WALLET_PIN_COST", 0)) or 2 ** 14
+SCRYPT_R, SCRYPT_P = 8, 1
+STEP_UP_TTL = 120.0
+
+def hash_pin(pin, scheme=None, cost=None):
+    scheme, salt = scheme or PIN_HASHER, os.urandom(16)
+    if scheme == "scrypt":
+        n = cost or SCRYPT_N
+        dk = hashlib.scrypt(pin.encode(), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P, maxmem=256 * n * SCRYPT_R, dklen=32)
+        return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${dk.hex()}"
+    if scheme == "pbkdf2":
+        it = cost or PBKDF2_ITERATIONS
+        return f"pbkdf2_sha256${it}${salt.hex()}${hashlib.pbkdf2_hmac('sha256', pin.encode(), salt, it).hex()}"
+    raise ValueError(f"Unknown PIN hasher: {scheme}")
+
+def verify_pin(pin, stored):
+    parts = stored.split("$")
+    if parts[0] == "pbkdf2_sha256":
+        it, salt, want = int(parts[1]), bytes.fromhex(parts[2]), parts[3]
+        got = hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, it).hex()
+    elif parts[0] == "scrypt":
+        n, r, p, salt, want = int(parts[1]), int(parts[2]), int(parts[3]), bytes.fromhex(parts[4]), parts[5]
+        got = hashlib.scrypt(pin.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32).hex()
+    else:
+        want, got = stored, hashlib.sha256(pin.encode()).hexdigest()  # legacy unsalted SHA-256
+    return hmac.compare_digest(got, want)
+
+def needs_rehash(stored):
+    parts = stored.split("$")
+    if PIN_HASHER == "scrypt": return parts[0] != "scrypt" or int(parts[1]) != SCRYPT_N
+    return parts[0] != "pbkdf2_sha256" or int(parts[1]) != PBKDF2_ITERATIONS
+
+class StepUpCache:
+    """Short-lived, in-memory record of recent PIN verifications per session."""
+
+    def __init__(self, ttl=STEP_UP_TTL, max_entries=10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()  # token -> (user, stored hash, pin digest, expiry)
+        self._lock = threading.Lock()
+
+    def _digest(self, pin):
+        return hmac.new(self._key, pin.encode(), hashlib.sha256).digest()
+
+    def remember(self, token, user, pin, stored):
+        with self._lock:
+            self._entries[token] = (user, stored, self._digest(pin), time.monotonic() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+    def verify(self, token, user, pin, stored):
+        """Check `pin` against `stored`, paying the KDF only outside the TTL."""
+        with self._lock: entry = self._entries.get(token)
+        if entry and entry[0] == user and entry[1] == stored and entry[3] > time.monotonic():
+            return hmac.compare_digest(entry[2], self._digest(pin))
+        if not verify_pin(pin, stored): return False
+        self.remember(token, user, pin, stored)
+        return True
+
+    def revoke(self, token):
+        with self._lock: self._entries.pop(token, None)
+
+STEP_UP = StepUpCache()
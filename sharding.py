@@ -0,0 +1,283 @@
+"""
+Sharded account storage for multi-process deployments
+-------------------------------------------------------
+ShardedStore spreads accounts over N shard stores (JSON journals or SQLite
+files) by a stable hash of the username, behind the same Storage interface,
+so several app processes (Streamlit replicas behind a load balancer, batch
+workers) can share one set of files:
+
+- Every shard has a lock file. Writers hold an fcntl.flock on it around each
+  read-check-write (Ledger takes them through `exclusive`, in shard order),
+  and every access first catches the shard up with what other processes
+  appended (`Storage.refresh`). One process never clobbers another's writes.
+- A write touching one shard is a single append to it. A write touching
+  several (a transfer or QR payment between users on different shards) uses
+  a transactional outbox: the first user's shard appends its own records
+  together with an outbox entry holding the other shards' records, each
+  other shard appends its part with an inbox marker, and the entry is then
+  marked sent. A crash in between leaves the entry pending; `relay()` (run at
+  start-up and every few seconds, by any process) delivers it, and inbox
+  markers make the delivery exactly-once.
+
+Derived state (aggregates, admin counters, risk features) stays per process
+and follows other replicas' writes as headers are refreshed. The idempotency
+cache and the standing-instruction worker are per process too: keep a user's
+session on one replica and run the scheduler in exactly one
+(WALLET_SCHEDULER=off elsewhere). Its rescan picks up instructions the other
+replicas save within a minute (scheduler.RESCAN_SECONDS).
+
+Enable with WALLET_SHARDS=N (and WALLET_BACKEND as usual). Existing data:
+    python sharding.py split --shards 4        # copy the single store into shards
+    python sharding.py status --shards 4       # accounts, funds and pending outbox per shard
+"""
+
+import argparse
+import os
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+
+try: import fcntl
+except ImportError: fcntl = None  # no flock (Windows): safe across threads, not processes
+
+from storage import (DB_FILE, SQLITE_FILE, JournalStore, SQLiteStore, Storage, create_record,
+                     inbox_record, outbox_record, sent_record)
+from txnid import IdGenerator
+
+RELAY_INTERVAL = 5.0
+_ids = IdGenerator(prefix="OBX-")
+
+def shard_of(user, shards):
+    return zlib.crc32(user.encode()) % shards  # stable across processes, unlike hash()
+
+def shard_paths(backend, shards, base=None):
+    root, ext = os.path.splitext(base or (DB_FILE if backend == "json" else SQLITE_FILE))
+    return [f"{root}.shard{i}-of-{shards}{ext}" for i in range(shards)]
+
+class ShardLock:
+    """Re-entrant lock held across this process's threads and, via flock, across processes."""
+
+    def __init__(self, path, on_acquire=None):
+        self.on_acquire = on_acquire
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0:
+            try:
+                if fcntl: fcntl.flock(self._fd, fcntl.LOCK_EX)
+                self._depth = 1
+                if self.on_acquire: self.on_acquire()
+            except BaseException:
+                self._release(); raise
+        else: self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._release()
+
+    def _release(self):
+        self._depth = max(0, self._depth - 1)
+        if self._depth == 0 and fcntl: fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rlock.release()
+
+    def close(self):
+        os.close(self._fd)
+
+class ShardedStore(Storage):
+    shared = True
+
+    def __init__(self, backend="json", shards=4, default=dict, base=None, relay_interval=RELAY_INTERVAL):
+        self.backend, self.paths = backend, shard_paths(backend, shards, base)
+        self.shards, self.locks = [], []
+        self.deferred = 0  # cross-shard deliveries left to the relay
+        defaults = []
+
+        def part(i):
+            if not defaults: defaults.append(default())  # only built if a shard is new
+            return {u: a for u, a in defaults[0].items() if shard_of(u, shards) == i}
+
+        for i, path in enumerate(self.paths):
+            shard = (JournalStore(path, default=lambda i=i: part(i)) if backend == "json"
+                     else SQLiteStore(path, default=lambda i=i: part(i)))
+            lock = ShardLock(path + ".lock", on_acquire=shard.refresh)
+            shard.file_lock = lock  # background compaction (JournalStore) must hold it too
+            with lock: pass  # first access creates or loads the shard, under its lock
+            self.shards.append(shard); self.locks.append(lock)
+        self._stop = threading.Event()
+        if relay_interval:  # tools that only inspect or seed the shards pass 0
+            self.relay()
+            threading.Thread(target=self._relay_loop, args=(relay_interval,), name="wallet-relay", daemon=True).start()
+
+    def shard(self, user):
+        return shard_of(user, len(self.shards))
+
+    @contextmanager
+    def exclusive(self, *users):
+        """Hold the file locks of `users`' shards, always taken in shard order."""
+        with ExitStack() as stack:
+            for i in sorted({self.shard(u) for u in users}): stack.enter_context(self.locks[i])
+            yield
+
+    def _fresh(self, user):
+        # Reads need the lock only to catch up; the shard's own lock covers the read itself.
+        i = self.shard(user)
+        with self.locks[i]: return self.shards[i]
+
+    def _each(self):
+        for i, shard in enumerate(self.shards):
+            with self.locks[i]: pass
+            yield shard
+
+    # --- writes ---
+    def append(self, *records):
+        groups = {}
+        for rec in records: groups.setdefault(self.shard(rec["user"]), []).append(rec)
+        with self.exclusive(*(rec["user"] for rec in records)):
+            if len(groups) == 1:
+                (i, group), = groups.items()
+                self.shards[i].append(*group)
+                return
+            user = records[0]["user"]
+            home, oid = self.shard(user), _ids.next()
+            remote = [(j, group) for j, group in groups.items() if j != home]
+            self.shards[home].append(*groups[home], outbox_record(user, oid, remote))
+            try:
+                for j, group in remote: self.shards[j].append(*group, inbox_record(group[0]["user"], oid))
+                self.shards[home].append(sent_record(user, oid))
+            except Exception:
+                self.deferred += 1  # committed with the home append; relay() completes it
+
+    def relay(self):
+        """Deliver outbox entries a crash left pending; any process may run it at any time."""
+        done = 0
+        for i, shard in enumerate(self.shards):
+            with self.locks[i]: pending = shard.pending_outbox()
+            for entry in pending:
+                for j, group in entry["deliveries"]:  # one lock at a time: never waits while holding one
+                    with self.locks[j]:
+                        if not self.shards[j].received(entry["id"]):
+                            self.shards[j].append(*group, inbox_record(group[0]["user"], entry["id"]))
+                with self.locks[i]: shard.append(sent_record(entry["user"], entry["id"]))
+                done += 1
+        return done
+
+    def standing_changes(self, cursor=None):
+        # The cursor is one position per shard.
+        users, cursors = [], []
+        for i, shard in enumerate(self.shards):
+            with self.locks[i]: part, c = shard.standing_changes(cursor[i] if cursor else None)
+            users += part; cursors.append(c)
+        return users, tuple(cursors)
+
+    def _relay_loop(self, interval):
+        while not self._stop.wait(interval):
+            try: self.relay()
+            except Exception: pass  # retried on the next tick
+
+    # --- single-user reads ---
+    def get_account(self, user): return self._fresh(user).get_account(user)
+    def transactions(self, user, limit=None): return self._fresh(user).transactions(user, limit)
+    def counterparties(self, user, types): return self._fresh(user).counterparties(user, types)
+    def notifications(self, user, offset=0, limit=None): return self._fresh(user).notifications(user, offset, limit)
+    def notification_count(self, user): return self._fresh(user).notification_count(user)
+
+    def query_transactions(self, user, cursor=None, limit=50, start=None, end=None,
+                           types=None, category=None, counterparty=None):
+        return self._fresh(user).query_transactions(user, cursor, limit, start, end, types, category, counterparty)
+
+    # --- whole-ledger reads ---
+    def load(self):
+        accounts = {}
+        for shard in self._each(): accounts.update(shard.load())
+        return accounts
+
+    def account_summaries(self):
+        return [row for shard in self._each() for row in shard.account_summaries()]
+
+    def account_page(self, cursor=None, limit=100, search=None):
+        # The cursor is (shard, that shard's cursor): shards are paged one after another.
+        i, inner = cursor or (0, None)
+        rows = []
+        while i < len(self.shards):
+            with self.locks[i]: part, inner = self.shards[i].account_page(inner, limit - len(rows), search)
+            rows += part
+            if inner is not None: return rows, (i, inner)
+            i += 1
+            if len(rows) == limit: return rows, ((i, None) if i < len(self.shards) else None)
+        return rows, None
+
+    def txn_rollup(self):
+        counts, daily = {}, {}
+        for shard in self._each():
+            c, d = shard.txn_rollup()
+            for k, v in c.items(): counts[k] = counts.get(k, 0) + v
+            for k, v in d.items(): daily[k] = daily.get(k, 0.0) + v
+        return counts, daily
+
+    def iter_txn_chunks(self, user=None, size=50_000):
+        if user is not None:
+            yield from self._fresh(user).iter_txn_chunks(user, size)
+            return
+        for shard in self._each(): yield from shard.iter_txn_chunks(None, size)
+
+    def iter_accounts(self):
+        for shard in self._each(): yield from shard.iter_accounts()
+
+    # --- lifecycle ---
+    def flush(self):
+        for i, shard in enumerate(self.shards):
+            with self.locks[i]: shard.flush()
+
+    def close(self):
+        self._stop.set()
+        for i, shard in enumerate(self.shards):
+            with self.locks[i]: shard.close()
+            self.locks[i].close()
+
+    def after_fork(self):
+        # flock belongs to the open file, which a fork shares: the child needs its own.
+        clone = object.__new__(ShardedStore)
+        clone.backend, clone.paths, clone.deferred = self.backend, self.paths, 0
+        clone.shards = [s.after_fork() for s in self.shards]
+        clone.locks = [ShardLock(p + ".lock", on_acquire=s.refresh) for p, s in zip(self.paths, clone.shards)]
+        for shard, lock in zip(clone.shards, clone.locks): shard.file_lock = lock
+        clone._stop = threading.Event()
+        return clone
+
+def split(src, backend, shards, batch=500):
+    """Copy every account of an unsharded store into a fresh set of shards."""
+    dst = ShardedStore(backend, shards, relay_interval=0)
+    chunk, n = [], 0
+    for user, acc in src.iter_accounts():
+        chunk.append(create_record(user, acc)); n += 1
+        if len(chunk) >= batch: dst.append(*chunk); chunk = []
+    if chunk: dst.append(*chunk)
+    dst.close()
+    return n
+
+def main():
+    from storage import open_store
+    ap = argparse.ArgumentParser(description="Sharded storage tools")
+    ap.add_argument("cmd", choices=("split", "status"))
+    ap.add_argument("--shards", type=int, default=int(os.environ.get("WALLET_SHARDS", 4)))
+    ap.add_argument("--backend", choices=("json", "sqlite"), default=os.environ.get("WALLET_BACKEND", "json"))
+    args = ap.parse_args()
+    if args.cmd == "split":
+        if any(os.path.exists(p) for p in shard_paths(args.backend, args.shards)):
+            raise SystemExit("shard files already exist; remove them first")
+        src = open_store(args.backend, shards=1)
+        print(f"Copied {split(src, args.backend, args.shards):,} accounts into {args.shards} shards")
+        src.close()
+    else:
+        store = ShardedStore(args.backend, args.shards, relay_interval=0)
+        for path, shard in zip(store.paths, store._each()):
+            heads = shard.load()
+            print(f"{path:36s} {len(heads):8,} accounts  ₹{sum(a['balance'] for a in heads.values()):16,.2f}  "
+                  f"pending outbox {len(shard.pending_outbox())}")
+        store.close()
+
+if __name__ == "__main__":
+    main()
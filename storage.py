@@ -0,0 +1,820 @@
+"""
+Storage engine for SkyWallet Pro
+-------------------------------------------------------
+Every change to the wallet is described as a small mutation record
+(account created, balance delta + transaction, notification, field update).
+Backends apply those records and answer the few queries the pages need, so a
+page only materializes the rows it shows.
+
+- JournalStore: snapshot + append-only journal. Write cost depends on the size
+  of the change, not the size of the database. The snapshot keeps the original
+  `{"accounts": {...}}` shape of wallet_data.json; in memory, histories are
+  compact columns (see txncolumns.py).
+- SQLiteStore: stdlib sqlite3 in WAL mode with separate accounts, transactions
+  and notifications tables.
+
+Each inbox keeps the newest NOTIFY_LIMIT notifications (WALLET_NOTIFY_LIMIT,
+default 100); older ones spill over to an archive (a JSONL file next to the
+JSON snapshot, or the notifications_archive table). The account header keeps
+an `unread` counter so the sidebar badge never touches the inbox itself.
+
+Pick one with WALLET_BACKEND=json|sqlite; WALLET_SHARDS=N spreads accounts
+over N of them for multi-process use (sharding.py). Migrate existing data with:
+    python storage.py migrate wallet_data.json wallet_data.db
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+
+from aggregates import INFLOW_LEGS
+from txncolumns import TXN_FIELDS, TxnColumns, txn_ts
+
+DB_FILE = "wallet_data.json"
+SQLITE_FILE = "wallet_data.db"
+HEADER_FIELDS = ("pin", "balance", "locked", "is_verified", "enable_2fa")
+TXN_COLUMNS = ("ts", "type", "amount", "category", "counterparty")  # iter_txn_chunks row layout
+NOTIFY_LIMIT = int(os.environ.get("WALLET_NOTIFY_LIMIT", 100))
+INBOX_KEEP = 100_000  # delivered outbox ids a JSON shard remembers, for deduplication
+_encode = json.JSONEncoder(separators=(",", ":"), default=list).encode  # default: inbox deques
+
+# ---------------------------------------------------------
+# 1. MUTATION RECORDS
+# ---------------------------------------------------------
+def create_record(user, account):
+    return {"op": "create", "user": user, "account": account}
+
+def txn_record(user, delta, txn):
+    return {"op": "txn", "user": user, "delta": delta, "txn": txn}
+
+def set_record(user, **fields):
+    return {"op": "set", "user": user, "fields": fields}
+
+def notify_record(user, notif):
+    return {"op": "notify", "user": user, "notif": notif}
+
+def clear_notifications_record(user):
+    return {"op": "clear_notifications", "user": user}
+
+def read_notifications_record(user):
+    return {"op": "read_notifications", "user": user}
+
+# Cross-shard bookkeeping (see sharding.py): kept by the store, not by any account.
+OUTBOX_OPS = ("outbox", "sent", "inbox")
+
+def outbox_record(user, oid, deliveries):
+    return {"op": "outbox", "user": user, "id": oid, "deliveries": deliveries}  # [(shard, records), ...]
+
+def sent_record(user, oid):
+    return {"op": "sent", "user": user, "id": oid}
+
+def inbox_record(user, oid):
+    return {"op": "inbox", "user": user, "id": oid}
+
+def normalize_account(acc):
+    if not isinstance(acc.get("transactions"), TxnColumns): acc["transactions"] = TxnColumns(acc.get("transactions", ()))
+    acc["notifications"] = deque(acc.get("notifications", ()))  # newest first
+    acc.setdefault("unread", min(len(acc["notifications"]), NOTIFY_LIMIT))
+    acc.setdefault("is_verified", False)
+    return acc
+
+def account_header(acc):
+    return {k: v for k, v in acc.items() if k not in ("transactions", "notifications")}
+
+def apply_record(accounts, rec, headers=False):
+    """Apply one mutation record to an in-memory accounts dict.
+
+    Header-only accounts (as returned by `Storage.load`) carry no lists and
+    only get their balance and fields updated; with `headers` a create record
+    also only keeps the header. Returns the notifications pushed out of a
+    full inbox, oldest last.
+    """
+    op, user = rec["op"], rec["user"]
+    evicted = []
+    if op in OUTBOX_OPS: return evicted
+    if op == "create":
+        acc = rec["account"]
+        if headers or "transactions" not in acc:
+            head = copy.deepcopy(account_header(acc))
+            head.setdefault("unread", min(len(acc.get("notifications", ())), NOTIFY_LIMIT))
+            head.setdefault("is_verified", False)
+            accounts[user] = head
+        else: accounts[user] = normalize_account(copy.deepcopy(acc))
+        return evicted
+    acc = accounts.get(user)
+    if acc is None: return evicted
+    if op == "txn":
+        acc["balance"] += rec["delta"]
+        if "transactions" in acc: acc["transactions"].append(rec["txn"])
+    elif op == "set":
+        acc.update(rec["fields"])
+    elif op == "notify":
+        acc["unread"] = min(acc.get("unread", 0) + 1, NOTIFY_LIMIT)
+        inbox = acc.get("notifications")
+        if inbox is not None:
+            inbox.appendleft(rec["notif"])
+            while len(inbox) > NOTIFY_LIMIT: evicted.append(inbox.pop())
+    elif op == "clear_notifications":
+        acc["unread"] = 0
+        if "notifications" in acc: acc["notifications"] = deque()
+    elif op == "read_notifications":
+        acc["unread"] = 0
+    else:
+        raise ValueError(f"Unknown record op: {op}")
+    return evicted
+
+def rollup_txn(counts, daily, txn, sign=1):
+    """Add one transaction (sign=-1: remove it) to a (count by type, daily volume) rollup."""
+    kind = txn["type"]
+    counts[kind] = counts.get(kind, 0) + sign
+    if not counts[kind]: del counts[kind]
+    if kind not in INFLOW_LEGS:
+        day = txn["timestamp"][:10]
+        daily[day] = daily.get(day, 0.0) + sign * txn["amount"]
+
+# ---------------------------------------------------------
+# 2. STORAGE INTERFACE
+# ---------------------------------------------------------
+class Storage:
+    """What the app needs from a backend.
+
+    `load()` returns account headers only (no transaction or notification
+    lists); pages fetch the rows they display through the query methods.
+    Transactions are returned oldest first, except by `query_transactions`
+    which pages newest first: it returns `(rows, next_cursor)`, where the
+    cursor is an opaque position to pass back for the next (older) page and
+    is None on the last page. `account_page` pages (user, balance, txn count)
+    rows the same way, and `txn_rollup` returns (count by type, daily volume)
+    for the whole ledger, leaving out the *_in mirror legs from volume; stores
+    keep it up to date as records are applied and persist it with the data,
+    so reading it at startup does not scan any history.
+    `iter_txn_chunks` streams (ts, type, amount, category, counterparty)
+    tuples in lists of up to `size`, for one user or everyone, oldest first
+    per user, without materializing the whole history.
+    `after_fork` is called in a forked worker process (see scoring.py) and
+    returns a store that child can read through without touching the
+    parent's locks or connections.
+
+    A `shared` store is written by several processes (sharding.py): callers
+    hold `exclusive(*users)` around read-check-write sequences and re-read
+    what they cached. `refresh` catches a shard up with other processes'
+    writes, and `pending_outbox` / `received` expose the cross-shard outbox.
+    `standing_changes(cursor)` returns `(users, next_cursor)`: the users whose
+    standing instructions were written since `cursor` (None: since the store
+    was opened), so a scheduler can follow other processes without a load().
+    """
+
+    shared = False
+
+    def load(self): raise NotImplementedError
+    def append(self, *records): raise NotImplementedError
+    def get_account(self, user): raise NotImplementedError
+    def transactions(self, user, limit=None): raise NotImplementedError
+    def query_transactions(self, user, cursor=None, limit=50, start=None, end=None,
+                           types=None, category=None, counterparty=None): raise NotImplementedError
+    def counterparties(self, user, types): raise NotImplementedError
+    def notifications(self, user, offset=0, limit=None): raise NotImplementedError
+    def notification_count(self, user): raise NotImplementedError
+    def account_summaries(self): raise NotImplementedError
+    def account_page(self, cursor=None, limit=100, search=None): raise NotImplementedError
+    def txn_rollup(self): raise NotImplementedError
+    def iter_txn_chunks(self, user=None, size=50_000): raise NotImplementedError
+    def iter_accounts(self): raise NotImplementedError
+    def flush(self): pass
+    def close(self): pass
+    def after_fork(self): return self  # a store a forked child can read from
+    def exclusive(self, *users): return nullcontext()
+    def refresh(self): pass
+    def pending_outbox(self): raise NotImplementedError
+    def received(self, oid): raise NotImplementedError
+    def standing_changes(self, cursor=None): raise NotImplementedError
+
+def open_store(backend=None, default=dict, shards=None):
+    backend = backend or os.environ.get("WALLET_BACKEND", "json")
+    shards = shards or int(os.environ.get("WALLET_SHARDS", 1))
+    if shards > 1:
+        from sharding import ShardedStore
+        return ShardedStore(backend, shards, default=default)
+    if backend == "json": return JournalStore(DB_FILE, default=default)
+    if backend == "sqlite": return SQLiteStore(SQLITE_FILE, default=default)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+# ---------------------------------------------------------
+# 3. JOURNAL STORE
+# ---------------------------------------------------------
+class JournalStore(Storage):
+    """Snapshot + append-only journal, replayed on startup.
+
+    Each `append` call is one journal line holding all of its records, so a
+    multi-record operation (e.g. both legs of a transfer) survives a crash
+    entirely or not at all. Lines carry a sequence number and the snapshot
+    remembers the last one it contains, so a crash between writing a snapshot
+    and truncating the journal never applies a record twice.
+
+    A compacted journal starts with a header line holding a fresh token;
+    `refresh` compares it to tell "other processes appended" (replay from the
+    last offset) from "another process compacted" (reload).
+
+    Appends only fsync every `fsync_every` records. A maintenance thread,
+    started by the first append, fsyncs what is older than `fsync_interval`
+    even when no further append comes, and compacts once the journal holds
+    `compact_every` records, so no writer waits for a snapshot. On a shared
+    store it compacts under `file_lock` (the shard's flock, set by sharding.py).
+    """
+
+    def __init__(self, path, default=dict, fsync_every=64, fsync_interval=1.0, compact_every=10_000):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + ".journal"
+        self.archive_path = os.path.splitext(path)[0] + ".notif_archive.jsonl"
+        self.default = default
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.lock = threading.RLock()
+        self.accounts = None
+        self.seq = 0
+        self.journal_len = 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.outbox = {}             # oid -> outbox record not yet marked sent
+        self.inbox = OrderedDict()   # oids already delivered here, newest last
+        self.counts, self.daily = {}, {}  # txn_rollup, saved in the snapshot
+        self._fh = None
+        self._offset = 0             # journal bytes applied to the replica
+        self._gen = None             # token in the journal's header line, new on every compaction
+        self._standing = OrderedDict()  # user -> change number of their last instruction write, newest last
+        self._standing_n = 0
+        self.file_lock = nullcontext()  # held around background compaction
+        self._maint = None              # maintenance thread
+        self._stop = threading.Event()
+
+    def load(self):
+        with self.lock:
+            self._ensure_loaded()
+            return {u: account_header(a) for u, a in self.accounts.items()}
+
+    def get_account(self, user):
+        with self.lock:
+            self._ensure_loaded()
+            acc = self.accounts.get(user)
+            return account_header(acc) if acc else None
+
+    def transactions(self, user, limit=None):
+        with self.lock:
+            self._ensure_loaded()
+            txns = self.accounts[user]["transactions"] if user in self.accounts else []
+            return txns[-limit:] if limit else list(txns)
+
+    def query_transactions(self, user, cursor=None, limit=50, start=None, end=None,
+                           types=None, category=None, counterparty=None):
+        with self.lock:
+            self._ensure_loaded()
+            if user not in self.accounts: return [], None
+            txns = self.accounts[user]["transactions"]
+            rows, nxt = txns.find(cursor, limit, start, end, types, category, counterparty)
+            return [txns.row(i) for i in rows], nxt
+
+    def counterparties(self, user, types):
+        with self.lock:
+            self._ensure_loaded()
+            return sorted(self.accounts[user]["transactions"].counterparties(types))
+
+    def notifications(self, user, offset=0, limit=None):
+        with self.lock:
+            self._ensure_loaded()
+            if user not in self.accounts: return []
+            inbox = self.accounts[user]["notifications"]
+            return list(itertools.islice(inbox, offset, None if limit is None else offset + limit))
+
+    def notification_count(self, user):
+        with self.lock:
+            self._ensure_loaded()
+            return len(self.accounts[user]["notifications"]) if user in self.accounts else 0
+
+    def account_summaries(self):
+        with self.lock:
+            self._ensure_loaded()
+            return [(u, a["balance"], len(a["transactions"])) for u, a in self.accounts.items()]
+
+    def account_page(self, cursor=None, limit=100, search=None):
+        with self.lock:
+            self._ensure_loaded()
+            pos, rows = cursor or 0, []
+            for user, acc in itertools.islice(self.accounts.items(), pos, None):
+                pos += 1
+                if search and search not in user: continue
+                rows.append((user, acc["balance"], len(acc["transactions"])))
+                if len(rows) == limit: break
+            return rows, (pos if len(rows) == limit and pos < len(self.accounts) else None)
+
+    def iter_txn_chunks(self, user=None, size=50_000):
+        with self.lock:
+            self._ensure_loaded()
+            users = list(self.accounts) if user is None else [user]
+        chunk = []
+        for u in users:
+            with self.lock:
+                acc = self.accounts.get(u)
+                if acc is None: continue
+                txns, n = acc["transactions"], len(acc["transactions"])  # columns only grow: rows < n are stable
+            for row in txns.analytics_rows(0, n):
+                chunk.append(row)
+                if len(chunk) == size: yield chunk; chunk = []
+        if chunk: yield chunk
+
+    def txn_rollup(self):
+        with self.lock:
+            self._ensure_loaded()
+            return dict(self.counts), dict(self.daily)
+
+    def iter_accounts(self):
+        with self.lock:
+            self._ensure_loaded()
+            items = list(self.accounts.items())
+        yield from items
+
+    def append(self, *records):
+        with self.lock:
+            self._ensure_loaded()
+            if not records: return
+            line = _encode({"seq": self.seq + 1, "records": records}) + "\n"
+            fh = self._journal()
+            fh.write(line)
+            fh.flush()
+            self.seq += 1
+            self._offset += len(line)  # ASCII: _encode escapes everything else
+            spilled = []
+            for rec in records:
+                spilled.extend(_encode({"user": rec["user"], "notif": n}) for n in self._apply(rec))
+            if spilled:
+                with open(self.archive_path, "a") as f: f.write("\n".join(spilled) + "\n")
+            self.journal_len += len(records)
+            self.unsynced += len(records)
+            if self.unsynced >= self.fsync_every: self._sync()
+            if self._maint is None:
+                self._maint = threading.Thread(target=self._maintain, name="wallet-journal", daemon=True)
+                self._maint.start()
+
+    def flush(self):
+        with self.lock:
+            if self._fh and self.unsynced: self._sync()
+
+    def compact(self):
+        """Write a fresh snapshot of the replica and start an empty journal."""
+        with self.lock:
+            self._ensure_loaded()
+            tmp = self.path + ".tmp"
+            snap = {"accounts": self.accounts, "journal_seq": self.seq}
+            if self.outbox: snap["outbox"] = self.outbox
+            if self.inbox: snap["inbox"] = list(self.inbox)
+            snap["rollup"] = {"counts": self.counts, "daily": self.daily}
+            with open(tmp, "w") as f:
+                json.dump(snap, f, separators=(",", ":"), default=list)
+                f.flush(); os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            if self._fh: self._fh.close()
+            self._fh = open(self.journal_path, "a")  # O_APPEND: other processes' lines never get overwritten
+            self._fh.truncate(0)
+            self._gen = os.urandom(8).hex()
+            header = _encode({"gen": self._gen, "snapshot": self.seq}) + "\n"
+            self._fh.write(header); self._fh.flush()
+            self._offset = len(header)
+            self.journal_len = 0
+            self.unsynced = 0
+            self.last_sync = time.monotonic()
+
+    def close(self):
+        self._stop.set()
+        with self.lock:
+            self.flush()
+            if self._fh: self._fh.close(); self._fh = None
+
+    def after_fork(self):
+        # The replica is inherited copy-on-write; the lock and journal handle are the parent's.
+        self.lock, self._fh, self.unsynced = threading.RLock(), None, 0
+        self._maint, self._stop = None, threading.Event()  # the parent's thread did not survive the fork
+        return self
+
+    def refresh(self):
+        """Apply what other processes appended since; call under the shard's file lock."""
+        with self.lock:
+            if self.accounts is not None and self._journal_gen() != self._gen:
+                # Another process compacted: its snapshot holds everything we had and more.
+                self.accounts, self.seq, self.journal_len = None, 0, 0
+                self.outbox, self.inbox, self._offset = {}, OrderedDict(), 0
+            if self.accounts is None: self._ensure_loaded()
+            elif os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > self._offset:
+                self._replay_journal(self.seq, self._offset)
+
+    def pending_outbox(self):
+        with self.lock:
+            self._ensure_loaded()
+            return list(self.outbox.values())
+
+    def received(self, oid):
+        with self.lock:
+            self._ensure_loaded()
+            return oid in self.inbox
+
+    def standing_changes(self, cursor=None):
+        with self.lock:
+            self._ensure_loaded()
+            users = []
+            for user, n in reversed(self._standing.items()):
+                if cursor is not None and n <= cursor: break
+                users.append(user)
+            return users, self._standing_n
+
+    # --- internals ---
+    def _ensure_loaded(self):
+        if self.accounts is not None: return
+        accs, snap_seq, data = None, 0, {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                accs = data.get("accounts")
+                snap_seq = data.get("journal_seq", 0)
+            except (OSError, ValueError): accs = None
+        fresh = accs is None
+        if fresh: accs = self.default()
+        for user, acc in accs.items():
+            normalize_account(acc)
+            if acc.get("standing"): self._mark_standing(user)  # a reload may bring instructions never seen in the journal
+        self.accounts, self.seq = accs, snap_seq
+        self.outbox = data.get("outbox", {}) if not fresh else {}
+        self.inbox = OrderedDict.fromkeys(data.get("inbox", ()) if not fresh else ())
+        rollup = data.get("rollup") if not fresh else None
+        if rollup: self.counts, self.daily = rollup["counts"], rollup["daily"]
+        else:  # fresh, or a snapshot from before the rollup was saved: one pass over the columns
+            self.counts, self.daily = {}, {}
+            for acc in accs.values(): acc["transactions"].rollup(self.counts, self.daily, INFLOW_LEGS)
+        self._gen = None
+        self._replay_journal(snap_seq)
+        if fresh: self.compact()
+
+    def _replay_journal(self, snap_seq, start=0):
+        if not os.path.exists(self.journal_path): return
+        good = 0
+        with open(self.journal_path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"): break  # torn tail from a crash mid-write
+                try: entry = json.loads(line)
+                except ValueError: break
+                good += len(line)
+                if "gen" in entry: self._gen = entry["gen"]; continue  # header written by compact()
+                self.journal_len += len(entry["records"])
+                if entry["seq"] <= snap_seq: continue
+                for rec in entry["records"]: self._apply(rec)
+                self.seq = snap_seq = entry["seq"]
+        self._offset = start + good
+        if self._offset < os.path.getsize(self.journal_path):
+            with open(self.journal_path, "r+b") as f: f.truncate(self._offset)
+
+    def _apply(self, rec):
+        op = rec["op"]
+        if op == "outbox": self.outbox[rec["id"]] = rec
+        elif op == "sent": self.outbox.pop(rec["id"], None)
+        elif op == "inbox":
+            self.inbox[rec["id"]] = None
+            if len(self.inbox) > INBOX_KEEP: self.inbox.popitem(last=False)
+        else:
+            if op == "set" and "standing" in rec["fields"] or op == "create" and "standing" in rec["account"]:
+                self._mark_standing(rec["user"])
+            old = self.accounts.get(rec["user"]) if op == "create" else None
+            if old is not None: self._rollup_history(old["transactions"], -1)  # replaced wholesale
+            evicted = apply_record(self.accounts, rec)
+            if op == "txn" and rec["user"] in self.accounts: rollup_txn(self.counts, self.daily, rec["txn"])
+            elif op == "create": self._rollup_history(self.accounts[rec["user"]]["transactions"], 1)
+            return evicted
+        return ()
+
+    def _rollup_history(self, txns, sign):
+        counts, daily = {}, {}
+        txns.rollup(counts, daily, INFLOW_LEGS)
+        for k, v in counts.items():
+            self.counts[k] = self.counts.get(k, 0) + sign * v
+            if not self.counts[k]: del self.counts[k]
+        for k, v in daily.items(): self.daily[k] = self.daily.get(k, 0.0) + sign * v
+
+    def _mark_standing(self, user):
+        self._standing_n += 1
+        self._standing[user] = self._standing_n
+        self._standing.move_to_end(user)
+
+    def _journal_gen(self):
+        try:
+            with open(self.journal_path, "rb") as f: return json.loads(f.readline()).get("gen")
+        except (OSError, ValueError, AttributeError): return None
+
+    def _journal(self):
+        if self._fh is None: self._fh = open(self.journal_path, "a")
+        return self._fh
+
+    def _sync(self):
+        os.fsync(self._fh.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _maintain(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                with self.lock:
+                    if self._fh and self.unsynced and time.monotonic() - self.last_sync >= self.fsync_interval:
+                        self._sync()
+                if self.journal_len < self.compact_every: continue
+                with self.file_lock, self.lock:  # file lock first, as writers take them
+                    if self.journal_len >= self.compact_every and not self._stop.is_set(): self.compact()
+            except Exception: pass  # retried on the next tick; appends keep going meanwhile
+
+# ---------------------------------------------------------
+# 4. SQLITE STORE
+# ---------------------------------------------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    user TEXT PRIMARY KEY, balance REAL NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL,
+    id TEXT, timestamp TEXT, ts REAL, type TEXT, amount REAL, note TEXT,
+    category TEXT, counterparty TEXT, extra TEXT);
+CREATE TABLE IF NOT EXISTS notifications (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS notifications_archive (
+    seq INTEGER PRIMARY KEY, user TEXT NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS outbox (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS inbox (id TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS txn_counts (type TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS daily_volume (day TEXT PRIMARY KEY, amount REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS standing_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT UNIQUE NOT NULL);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_txn_user_ts ON transactions(user, ts);
+CREATE INDEX IF NOT EXISTS idx_txn_user_seq ON transactions(user, seq);
+CREATE INDEX IF NOT EXISTS idx_txn_counterparty ON transactions(counterparty);
+CREATE INDEX IF NOT EXISTS idx_txn_id ON transactions(id);
+CREATE INDEX IF NOT EXISTS idx_notif_user ON notifications(user, seq);
+"""
+
+INSERT_TXN = f"INSERT INTO transactions (user, {', '.join(TXN_FIELDS)}, extra) VALUES ({','.join('?' * (len(TXN_FIELDS) + 2))})"
+
+def _txn_row(user, txn):
+    extra = {k: v for k, v in txn.items() if k not in TXN_FIELDS}
+    return (user, *(txn_ts(txn) if k == "ts" else txn.get(k) for k in TXN_FIELDS), json.dumps(extra) if extra else None)
+
+def _row_txn(row):
+    txn = dict(zip(TXN_FIELDS, row[:len(TXN_FIELDS)]))
+    if row[-1]: txn.update(json.loads(row[-1]))
+    return txn
+
+class SQLiteStore(Storage):
+    """Relational backend; every `append` call is one SQLite transaction."""
+
+    def __init__(self, path, default=dict):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._upgrade_schema()
+        self.db.executescript(INDEXES)
+        self._backfill_rollup()
+        if not self.db.execute("SELECT 1 FROM accounts LIMIT 1").fetchone():
+            self.append(*(create_record(u, normalize_account(a)) for u, a in default().items()))
+        self._standing_base = self.db.execute("SELECT coalesce(max(seq), 0) FROM standing_log").fetchone()[0]
+
+    def load(self):
+        with self.lock:
+            rows = self.db.execute("SELECT user, balance, data FROM accounts").fetchall()
+        return {u: dict(json.loads(d), balance=b) for u, b, d in rows}
+
+    def get_account(self, user):
+        with self.lock:
+            row = self.db.execute("SELECT balance, data FROM accounts WHERE user=?", (user,)).fetchone()
+        return dict(json.loads(row[1]), balance=row[0]) if row else None
+
+    def append(self, *records):
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                for rec in records: self._apply(rec)
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def transactions(self, user, limit=None):
+        cols = ", ".join(TXN_FIELDS)
+        with self.lock:
+            if limit:
+                rows = self.db.execute(f"SELECT {cols}, extra FROM transactions WHERE user=? ORDER BY seq DESC LIMIT ?", (user, limit)).fetchall()
+                rows.reverse()
+            else:
+                rows = self.db.execute(f"SELECT {cols}, extra FROM transactions WHERE user=? ORDER BY seq", (user,)).fetchall()
+        return [_row_txn(r) for r in rows]
+
+    def query_transactions(self, user, cursor=None, limit=50, start=None, end=None,
+                           types=None, category=None, counterparty=None):
+        where, args = ["user=?"], [user]
+        for cond, val in (("seq<?", cursor), ("ts>=?", start), ("ts<=?", end),
+                          ("category=?", category), ("counterparty=?", counterparty)):
+            if val is not None: where.append(cond); args.append(val)
+        if types:
+            where.append(f"type IN ({','.join('?' * len(types))})"); args.extend(types)
+        sql = f"SELECT seq, {', '.join(TXN_FIELDS)}, extra FROM transactions WHERE {' AND '.join(where)} ORDER BY seq DESC LIMIT ?"
+        with self.lock:
+            rows = self.db.execute(sql, (*args, limit)).fetchall()
+        return [_row_txn(r[1:]) for r in rows], (rows[-1][0] if len(rows) == limit else None)
+
+    def counterparties(self, user, types):
+        marks = ",".join("?" * len(types))
+        with self.lock:
+            rows = self.db.execute(f"SELECT DISTINCT counterparty FROM transactions WHERE user=? AND type IN ({marks})", (user, *types)).fetchall()
+        return sorted(r[0] for r in rows)
+
+    def notifications(self, user, offset=0, limit=None):
+        with self.lock:
+            rows = self.db.execute("SELECT data FROM notifications WHERE user=? ORDER BY seq DESC LIMIT ? OFFSET ?",
+                                   (user, -1 if limit is None else limit, offset)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def notification_count(self, user):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM notifications WHERE user=?", (user,)).fetchone()[0]
+
+    def account_summaries(self):
+        with self.lock:
+            counts = dict(self.db.execute("SELECT user, COUNT(*) FROM transactions GROUP BY user"))
+            rows = self.db.execute("SELECT user, balance FROM accounts").fetchall()
+        return [(u, b, counts.get(u, 0)) for u, b in rows]
+
+    def account_page(self, cursor=None, limit=100, search=None):
+        sql = ("SELECT user, balance, (SELECT COUNT(*) FROM transactions t WHERE t.user = a.user) FROM accounts a "
+               "WHERE user > ?" + (" AND instr(user, ?) > 0" if search else "") + " ORDER BY user LIMIT ?")
+        with self.lock:
+            rows = self.db.execute(sql, (cursor or "", *((search,) if search else ()), limit)).fetchall()
+        return rows, (rows[-1][0] if len(rows) == limit else None)
+
+    def txn_rollup(self):
+        with self.lock:
+            counts = dict(self.db.execute("SELECT type, n FROM txn_counts WHERE n != 0"))
+            daily = dict(self.db.execute("SELECT day, amount FROM daily_volume"))
+        return counts, daily
+
+    def iter_txn_chunks(self, user=None, size=50_000):
+        # Keyset paging on seq: the lock is held per chunk, never across a yield.
+        sql = (f"SELECT seq, {', '.join(TXN_COLUMNS)} FROM transactions WHERE seq > ?"
+               + (" AND user=?" if user is not None else "") + " ORDER BY seq LIMIT ?")
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute(sql, (last, *(() if user is None else (user,)), size)).fetchall()
+            if not rows: return
+            last = rows[-1][0]
+            yield [r[1:] for r in rows]
+            if len(rows) < size: return
+
+    def iter_accounts(self):
+        for user, header in self.load().items():
+            header["transactions"] = self.transactions(user)
+            header["notifications"] = self.notifications(user)
+            yield user, header
+
+    def close(self):
+        with self.lock: self.db.close()
+
+    def after_fork(self):
+        return SQLiteStore(self.path)  # SQLite connections must not cross a fork
+
+    def pending_outbox(self):
+        with self.lock:
+            return [json.loads(r[0]) for r in self.db.execute("SELECT data FROM outbox")]
+
+    def received(self, oid):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM inbox WHERE id=?", (oid,)).fetchone() is not None
+
+    def standing_changes(self, cursor=None):
+        # One row per user, re-numbered on every write (AUTOINCREMENT never reuses a seq).
+        cursor = self._standing_base if cursor is None else cursor
+        with self.lock:
+            rows = self.db.execute("SELECT seq, user FROM standing_log WHERE seq > ? ORDER BY seq", (cursor,)).fetchall()
+        return [u for _, u in rows], (rows[-1][0] if rows else cursor)
+
+    def _upgrade_schema(self):
+        cols = {r[1] for r in self.db.execute("PRAGMA table_info(transactions)")}
+        if "ts" in cols: return
+        self.db.execute("ALTER TABLE transactions ADD COLUMN ts REAL")
+        self.db.execute("DROP INDEX IF EXISTS idx_txn_user_ts")
+        rows = self.db.execute("SELECT seq, timestamp FROM transactions").fetchall()
+        self.db.execute("BEGIN")
+        self.db.executemany("UPDATE transactions SET ts=? WHERE seq=?", ((txn_ts({"timestamp": t}), q) for q, t in rows))
+        self.db.execute("COMMIT")
+
+    def _backfill_rollup(self):
+        # Databases from before txn_counts existed: one pass, then kept up to date by _apply.
+        if self.db.execute("SELECT 1 FROM txn_counts LIMIT 1").fetchone(): return
+        if not self.db.execute("SELECT 1 FROM transactions LIMIT 1").fetchone(): return
+        self.db.execute("BEGIN")
+        self._rollup_rows("", 1)
+        self.db.execute("COMMIT")
+
+    def _rollup_rows(self, user, sign):
+        """Add (sign=-1: remove) the rollup of `user`'s transactions; "" means everyone's."""
+        where, args = ("user=?", (user,)) if user else ("true", ())  # upsert-from-SELECT needs a WHERE
+        marks = ",".join("?" * len(INFLOW_LEGS))
+        self.db.execute(f"INSERT INTO txn_counts SELECT type, ? * COUNT(*) FROM transactions WHERE {where} GROUP BY type "
+                        "ON CONFLICT(type) DO UPDATE SET n = n + excluded.n", (sign, *args))
+        self.db.execute(f"INSERT INTO daily_volume SELECT substr(timestamp, 1, 10), ? * SUM(amount) FROM transactions "
+                        f"WHERE {where} AND type NOT IN ({marks}) GROUP BY 1 "
+                        "ON CONFLICT(day) DO UPDATE SET amount = amount + excluded.amount", (sign, *args, *INFLOW_LEGS))
+
+    def _rollup_txn(self, txn):
+        self.db.execute("INSERT INTO txn_counts VALUES (?, 1) ON CONFLICT(type) DO UPDATE SET n = n + 1", (txn["type"],))
+        if txn["type"] not in INFLOW_LEGS:
+            self.db.execute("INSERT INTO daily_volume VALUES (?, ?) ON CONFLICT(day) DO UPDATE SET amount = amount + excluded.amount",
+                            (txn["timestamp"][:10], txn["amount"]))
+
+    def _apply(self, rec):
+        op, user = rec["op"], rec["user"]
+        if op == "create":
+            acc = rec["account"]
+            self._rollup_rows(user, -1)  # a create replaces any history the user had
+            header = {k: v for k, v in account_header(acc).items() if k != "balance"}
+            header.setdefault("unread", min(len(acc.get("notifications", [])), NOTIFY_LIMIT))
+            self.db.execute("INSERT OR REPLACE INTO accounts VALUES (?, ?, ?)", (user, acc["balance"], json.dumps(header)))
+            self.db.execute("DELETE FROM transactions WHERE user=?", (user,))
+            self.db.execute("DELETE FROM notifications WHERE user=?", (user,))
+            self.db.executemany(INSERT_TXN,
+                                (_txn_row(user, t) for t in acc.get("transactions", [])))
+            self.db.executemany("INSERT INTO notifications (user, data) VALUES (?, ?)",
+                                ((user, json.dumps(n)) for n in reversed(acc.get("notifications", []))))
+            self._rollup_rows(user, 1)
+            if "standing" in acc: self.db.execute("INSERT OR REPLACE INTO standing_log (user) VALUES (?)", (user,))
+        elif op == "txn":
+            self.db.execute("UPDATE accounts SET balance = balance + ? WHERE user=?", (rec["delta"], user))
+            self.db.execute(INSERT_TXN,
+                            _txn_row(user, rec["txn"]))
+            self._rollup_txn(rec["txn"])
+        elif op == "set":
+            row = self.db.execute("SELECT data FROM accounts WHERE user=?", (user,)).fetchone()
+            if row is None: return
+            fields = dict(rec["fields"])
+            if "balance" in fields:
+                self.db.execute("UPDATE accounts SET balance=? WHERE user=?", (fields.pop("balance"), user))
+            self.db.execute("UPDATE accounts SET data=? WHERE user=?", (json.dumps({**json.loads(row[0]), **fields}), user))
+            if "standing" in fields: self.db.execute("INSERT OR REPLACE INTO standing_log (user) VALUES (?)", (user,))
+        elif op == "notify":
+            self.db.execute("INSERT INTO notifications (user, data) VALUES (?, ?)", (user, json.dumps(rec["notif"])))
+            self.db.execute("UPDATE accounts SET data = json_set(data, '$.unread', min(coalesce(json_extract(data, '$.unread'), 0) + 1, ?)) "
+                            "WHERE user=?", (NOTIFY_LIMIT, user))
+            cut = self.db.execute("SELECT seq FROM notifications WHERE user=? ORDER BY seq DESC LIMIT 1 OFFSET ?",
+                                  (user, NOTIFY_LIMIT)).fetchone()
+            if cut:
+                self.db.execute("INSERT INTO notifications_archive SELECT * FROM notifications WHERE user=? AND seq<=?", (user, cut[0]))
+                self.db.execute("DELETE FROM notifications WHERE user=? AND seq<=?", (user, cut[0]))
+        elif op in ("clear_notifications", "read_notifications"):
+            self.db.execute("UPDATE accounts SET data = json_set(data, '$.unread', 0) WHERE user=?", (user,))
+            if op == "clear_notifications": self.db.execute("DELETE FROM notifications WHERE user=?", (user,))
+        elif op == "outbox":
+            self.db.execute("INSERT OR REPLACE INTO outbox VALUES (?, ?)", (rec["id"], _encode(rec)))
+        elif op == "sent":
+            self.db.execute("DELETE FROM outbox WHERE id=?", (rec["id"],))
+        elif op == "inbox":
+            self.db.execute("INSERT OR IGNORE INTO inbox VALUES (?)", (rec["id"],))
+        else:
+            raise ValueError(f"Unknown record op: {op}")
+
+# ---------------------------------------------------------
+# 5. MIGRATION
+# ---------------------------------------------------------
+def migrate_json_to_sqlite(json_path, db_path, batch=500):
+    """Copy a wallet_data.json (+ journal) into a fresh SQLite database."""
+    src = JournalStore(json_path)
+    dst = SQLiteStore(db_path)
+    chunk, n = [], 0
+    for user, acc in src.iter_accounts():
+        chunk.append(create_record(user, acc)); n += 1
+        if len(chunk) >= batch: dst.append(*chunk); chunk = []
+    dst.append(*chunk)
+    dst.close(); src.close()
+    return n
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="SkyWallet storage tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="copy a JSON wallet database into SQLite")
+    m.add_argument("src", nargs="?", default=DB_FILE)
+    m.add_argument("dst", nargs="?", default=SQLITE_FILE)
+    args = ap.parse_args()
+    if args.cmd == "migrate":
+        print(f"Migrated {migrate_json_to_sqlite(args.src, args.dst)} accounts to {args.dst}")
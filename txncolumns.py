@@ -0,0 +1,233 @@
+"""
+Compact columnar transaction lists
+-------------------------------------------------------
+The JSON backend keeps every account's history in memory. As dicts, each
+transaction costs several hundred bytes: the dict itself, an id string, a
+formatted timestamp, float objects and per-row copies of repeated strings.
+TxnColumns keeps the same rows as parallel columns instead:
+
+- ts: epoch seconds (int64); the "%Y-%m-%d %H:%M" timestamp is derived from it
+- amount: integer paise (int64)
+- type / category: 2-byte codes into process-wide intern tables
+- id / corr: TXN-<22 hex> ids packed into 64 + 32 bits (0 = no corr)
+- note / counterparty: references to shared, deduplicated strings
+
+Anything that does not fit (legacy ids, sub-paise amounts, a timestamp that
+disagrees with its ts, unknown fields) is kept verbatim in a per-row `extra`
+dict, so rows read back, and serialize to JSON, in their original shape.
+Sub-second precision of `ts` is the one thing not preserved.
+
+Rows are in append order, which is time order only as long as no clock steps
+back (another process, a simulated clock, imported history): `ordered`
+records whether ts has never decreased, and `find` only bisects and stops
+early on time bounds while it holds.
+"""
+
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+TXN_FIELDS = ("id", "timestamp", "ts", "type", "amount", "note", "category", "counterparty")
+_KNOWN = frozenset(TXN_FIELDS + ("corr",))
+_PACKED_ID = re.compile(r"TXN-[0-9a-f]{22}\Z")
+_NO_CODE = 0xFFFF
+_TS_RANGE = (-30_000_000_000, 200_000_000_000)  # epoch seconds datetime can format (years ~1000-8300)
+_PAISE_MAX = 2 ** 63 / 100
+
+def txn_ts(txn):
+    """Epoch seconds of a transaction; older records only carry the minute string."""
+    ts = txn.get("ts")
+    if ts is None: ts = datetime.strptime(txn["timestamp"], "%Y-%m-%d %H:%M").timestamp()
+    return ts
+
+@lru_cache(maxsize=1 << 16)
+def minute_stamp(minute):
+    return datetime.fromtimestamp(minute * 60).strftime("%Y-%m-%d %H:%M")
+
+def _day_bounds(sec):
+    """("YYYY-MM-DD", start, end) of the local day holding `sec`; DST days are not 24 h."""
+    start = datetime.fromtimestamp(sec).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.strftime("%Y-%m-%d"), start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+class Interner:
+    """Value <-> small integer code, shared by every TxnColumns in the process."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self._lock = threading.Lock()
+
+    def code(self, value):
+        c = self.codes.get(value)
+        if c is not None: return c
+        with self._lock:
+            c = self.codes.get(value)
+            if c is None and len(self.values) < _NO_CODE:
+                c = len(self.values)
+                self.values.append(value)
+                self.codes[value] = c
+            return c
+
+TYPES = Interner()
+CATEGORIES = Interner()
+_strings = {}
+
+def _shared(s):
+    return _strings.setdefault(s, s) if type(s) is str else s
+
+_id_match = _PACKED_ID.match
+
+def _pack(txn_id):
+    if type(txn_id) is not str or not _id_match(txn_id): return None
+    v = int(txn_id[4:], 16)
+    return v >> 32, v & 0xFFFFFFFF
+
+def _unpack(hi, lo):
+    return f"TXN-{hi << 32 | lo:022x}"
+
+class TxnColumns:
+    """List-like: len(), iteration, indexing and slicing yield transaction dicts."""
+
+    __slots__ = ("ts", "amount", "type", "category", "id_hi", "id_lo", "corr_hi", "corr_lo",
+                 "note", "counterparty", "extra", "ordered")
+
+    def __init__(self, txns=()):
+        self.ts, self.amount = array("q"), array("q")
+        self.type, self.category = array("H"), array("H")
+        self.id_hi, self.id_lo = array("Q"), array("I")
+        self.corr_hi, self.corr_lo = array("Q"), array("I")
+        self.note, self.counterparty = [], []
+        self.extra = {}  # row -> fields kept verbatim
+        self.ordered = True  # ts has never decreased
+        for txn in txns: self.append(txn)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def append(self, txn):
+        extra = {} if txn.keys() <= _KNOWN else {k: v for k, v in txn.items() if k not in _KNOWN}
+        ts = txn.get("ts")
+        raw = txn_ts(txn) if ts is None else ts
+        stamp = txn.get("timestamp")
+        if type(raw) in (int, float) and _TS_RANGE[0] <= raw < _TS_RANGE[1]:  # also rules out nan
+            sec = int(raw)
+            if self.ts and sec < self.ts[-1]: self.ordered = False
+            if stamp is not None and stamp != minute_stamp(sec // 60): extra["timestamp"] = stamp
+        else:
+            extra["ts"], sec, self.ordered = raw, 0, False
+            if stamp is not None: extra["timestamp"] = stamp
+        amt = txn["amount"]
+        # inf, nan and anything past int64 paise would make round() raise or the array overflow
+        paise = round(amt * 100) if type(amt) is float and math.isfinite(amt) and abs(amt) < _PAISE_MAX else None
+        if paise is None or paise / 100 != amt or not -2 ** 63 <= paise < 2 ** 63:
+            extra["amount"], paise = amt, 0
+        kind, cat = txn["type"], txn["category"]
+        kind_c, cat_c = TYPES.codes.get(kind), CATEGORIES.codes.get(cat)
+        if kind_c is None: kind_c = TYPES.code(kind)
+        if cat_c is None: cat_c = CATEGORIES.code(cat)
+        if kind_c is None: extra["type"], kind_c = kind, _NO_CODE
+        if cat_c is None: extra["category"], cat_c = cat, _NO_CODE
+        tid = _pack(txn.get("id"))
+        if tid is None: extra["id"], tid = txn.get("id"), (0, 0)
+        corr = (0, 0)
+        if "corr" in txn:
+            corr = _pack(txn["corr"])
+            if corr is None: extra["corr"], corr = txn["corr"], (0, 0)
+        # Values that do not fit a column were moved to `extra` above, so the appends
+        # below only see in-range numbers and known codes.
+        if extra: self.extra[len(self.ts)] = extra
+        self.ts.append(sec); self.amount.append(paise)
+        self.type.append(kind_c); self.category.append(cat_c)
+        self.id_hi.append(tid[0]); self.id_lo.append(tid[1])
+        self.corr_hi.append(corr[0]); self.corr_lo.append(corr[1])
+        self.note.append(_shared(txn["note"])); self.counterparty.append(_shared(txn["counterparty"]))
+
+    def row(self, i):
+        sec, kind, cat = self.ts[i], self.type[i], self.category[i]
+        txn = {"id": _unpack(self.id_hi[i], self.id_lo[i]), "timestamp": minute_stamp(sec // 60), "ts": sec,
+               "type": TYPES.values[kind] if kind != _NO_CODE else None, "amount": self.amount[i] / 100,
+               "note": self.note[i], "category": CATEGORIES.values[cat] if cat != _NO_CODE else None,
+               "counterparty": self.counterparty[i]}
+        if self.corr_hi[i] or self.corr_lo[i]: txn["corr"] = _unpack(self.corr_hi[i], self.corr_lo[i])
+        extra = self.extra.get(i)
+        if extra: txn.update(extra)
+        return txn
+
+    def __getitem__(self, i):
+        n = len(self.ts)
+        if isinstance(i, slice): return [self.row(j) for j in range(*i.indices(n))]
+        if i < 0: i += n
+        if not 0 <= i < n: raise IndexError("transaction index out of range")
+        return self.row(i)
+
+    def __iter__(self):
+        for i in range(len(self.ts)): yield self.row(i)
+
+    def __repr__(self):
+        return f"<TxnColumns {len(self.ts)} rows>"
+
+    def analytics_rows(self, start=0, stop=None):
+        """(ts, type, amount, category, counterparty) tuples without building dicts."""
+        stop = len(self.ts) if stop is None else stop
+        types, cats, extra = TYPES.values, CATEGORIES.values, self.extra
+        for i in range(start, stop):
+            if i in extra:
+                t = self.row(i)
+                yield t["ts"], t["type"], t["amount"], t["category"], t["counterparty"]
+            else:
+                yield self.ts[i], types[self.type[i]], self.amount[i] / 100, cats[self.category[i]], self.counterparty[i]
+
+    def find(self, stop=None, limit=50, start=None, end=None, types=None, category=None, counterparty=None):
+        """Indices of the newest `limit` matching rows before `stop`, newest first, and the
+        index to resume from (None: no more). Reads the columns; only rows with `extra`
+        fields are built as dicts."""
+        i = len(self.ts) if stop is None else min(stop, len(self.ts))
+        ts, kinds, cats, cps, extra, ordered = self.ts, self.type, self.category, self.counterparty, self.extra, self.ordered
+        if end is not None and ordered: i = bisect_right(ts, end, hi=i)
+        kind_codes = {TYPES.codes[t] for t in types if t in TYPES.codes} if types else None
+        cat_code = CATEGORIES.codes.get(category, -1) if category else None
+        found = []
+        while i > 0 and len(found) < limit:
+            i -= 1
+            sec = ts[i]
+            if start is not None and sec < start:
+                if ordered: i = 0; break
+                continue
+            if end is not None and sec > end: continue
+            if i in extra:
+                t = self.row(i)
+                if ((not types or t["type"] in types) and (not category or t["category"] == category)
+                        and (not counterparty or t["counterparty"] == counterparty)): found.append(i)
+                continue
+            if kind_codes is not None and kinds[i] not in kind_codes: continue
+            if cat_code is not None and cats[i] != cat_code: continue
+            if counterparty and cps[i] != counterparty: continue
+            found.append(i)
+        return found, (i if i > 0 else None)
+
+    def rollup(self, counts, daily, skip=()):
+        """Add row counts by type, and per-day volume of types not in `skip`, to the two dicts."""
+        types, extra, skip_codes = TYPES.values, self.extra, {TYPES.codes.get(t) for t in skip}
+        day, lo, hi = None, 0, 0
+        for i, (sec, code, paise) in enumerate(zip(self.ts, self.type, self.amount)):
+            if extra and i in extra:
+                t = self.row(i)  # kept verbatim: its own timestamp string decides the day
+                counts[t["type"]] = counts.get(t["type"], 0) + 1
+                d = t["timestamp"][:10]
+                if t["type"] not in skip: daily[d] = daily.get(d, 0.0) + t["amount"]
+                continue
+            kind = types[code]
+            counts[kind] = counts.get(kind, 0) + 1
+            if code in skip_codes: continue
+            if not lo <= sec < hi: day, lo, hi = _day_bounds(sec)  # rows are mostly in time order
+            daily[day] = daily.get(day, 0.0) + paise / 100
+
+    def counterparties(self, types):
+        codes = {TYPES.codes.get(t) for t in types}
+        found = {cp for code, cp in zip(self.type, self.counterparty) if code in codes}
+        found.update(self.counterparty[i] for i, ex in self.extra.items() if ex.get("type") in types)
+        return found
@@ -0,0 +1,92 @@
+"""
+Transaction ID generator
+-------------------------------------------------------
+IDs look like TXN-<ms:12 hex><node:8 hex><seq:2 hex>: a 48-bit millisecond
+timestamp, a 32-bit node id and an 8-bit per-millisecond sequence. Fixed-width
+hex keeps them sortable as plain strings, in creation order per node.
+
+The node id is unique per process: its low 22 bits are the pid (Linux never
+hands out pids above 2**22, and no two live processes share one), its high
+10 bits the host's WALLET_NODE_ID (0-1023; random when unset). Give every
+host a distinct WALLET_NODE_ID and no two processes can issue the same ID.
+Forked children re-derive the node from their own pid. Within a process a
+lock keeps IDs strictly increasing; when the sequence runs out inside one
+millisecond, or the clock steps back, the generator keeps counting on from
+the last timestamp it issued, and a fork never moves that timestamp back.
+"""
+
+import os
+import threading
+import time
+import weakref
+
+HOST_BITS, PID_BITS, SEQ_BITS = 10, 22, 8
+NODE_BITS = HOST_BITS + PID_BITS
+SEQ_MAX = (1 << SEQ_BITS) - 1
+_HOST = int.from_bytes(os.urandom(2), "big")  # drawn once, so every process of this host agrees
+
+def _node():
+    env = os.environ.get("WALLET_NODE_ID")
+    host = int(env) if env else _HOST
+    return (host & ((1 << HOST_BITS) - 1)) << PID_BITS | os.getpid() & ((1 << PID_BITS) - 1)
+
+class IdGenerator:
+    def __init__(self, prefix="TXN-", node=None):
+        self.prefix = prefix
+        self.node = _node() if node is None else node
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._seq = 0
+        self._head = ""  # prefix + ms + node, reused while the millisecond lasts
+        _generators.add(self)
+
+    def _make_head(self, ms):
+        return f"{self.prefix}{ms:012x}{self.node:08x}"
+
+    def next(self):
+        with self._lock:
+            ms = time.time_ns() // 1_000_000
+            if ms > self._last_ms:
+                self._last_ms, self._seq = ms, 0
+                self._head = self._make_head(ms)
+            elif self._seq < SEQ_MAX:
+                self._seq += 1
+            else:
+                self._last_ms, self._seq = self._last_ms + 1, 0
+                self._head = self._make_head(self._last_ms)
+            return f"{self._head}{self._seq:02x}"
+
+    def next_block(self, n):
+        """Reserve `n` consecutive IDs with a single lock round-trip."""
+        with self._lock:
+            ms = max(time.time_ns() // 1_000_000, self._last_ms)
+            seq = self._seq + 1 if ms == self._last_ms else 0
+            ids = []
+            while n > 0:
+                if seq > SEQ_MAX: ms, seq = ms + 1, 0
+                take = min(n, SEQ_MAX + 1 - seq)
+                head = self._make_head(ms)
+                ids.extend([f"{head}{s:02x}" for s in range(seq, seq + take)])
+                seq += take; n -= take
+            self._last_ms, self._seq = ms, seq - 1
+            self._head = self._make_head(ms)
+            return ids
+
+    def reseed(self):
+        # Runs in a forked child: the parent's lock may have been held at fork time.
+        self._lock = threading.Lock()
+        self.node = _node()
+        self._head = self._make_head(self._last_ms)  # same millisecond, new node: no overlap
+
+_generators = weakref.WeakSet()
+
+def _after_fork():
+    for gen in list(_generators): gen.reseed()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+_default = IdGenerator()
+
+def new_txn_id():
+    return _default.next()